@@ -0,0 +1,83 @@
+import json
+import threading
+from backend.config import (
+    BATCH_TOKEN_BUDGET, MIN_BATCH_TOKEN_BUDGET, MODEL_TOKEN_BUDGETS, MAX_BATCH_ROWS,
+    CHARS_PER_TOKEN, EXPECTED_VALUE_CHARS
+)
+
+
+def estimate_tokens(text: str):
+    """Rough token count; close enough to pack batches without a real tokenizer."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def estimate_row_tokens(row: dict, user_defined_columns: list, positional: bool = False):
+    """Prompt tokens for the row plus the tokens of the object (or positional array) the model writes back."""
+    # Rows go out as compact value arrays with their batch position as id
+    prompt_tokens = estimate_tokens(json.dumps(list(row.values()), separators=(",", ":"), default=str))
+    if positional:
+        expected_output = [0] + ["x" * EXPECTED_VALUE_CHARS for _ in user_defined_columns]
+    else:
+        expected_output = {"__row_id__": 0, **{col: "x" * EXPECTED_VALUE_CHARS for col in user_defined_columns}}
+    return prompt_tokens + estimate_tokens(json.dumps(expected_output))
+
+
+class TokenBudget:
+    """Per-model row token budget that shrinks on bad responses and recovers on good ones."""
+
+    def __init__(self, max_tokens: int, min_tokens: int):
+        self.max_tokens = max_tokens
+        self.min_tokens = min(min_tokens, max_tokens)
+        self.current = max_tokens
+        self._lock = threading.Lock()
+
+    def shrink(self):
+        with self._lock:
+            self.current = max(self.min_tokens, self.current // 2)
+
+    def grow(self):
+        with self._lock:
+            self.current = min(self.max_tokens, int(self.current * 1.1) + 1)
+
+
+_token_budgets = {}
+
+
+def get_token_budget(model: str):
+    if model not in _token_budgets:
+        max_tokens = MODEL_TOKEN_BUDGETS.get(model, BATCH_TOKEN_BUDGET)
+        _token_budgets[model] = TokenBudget(max_tokens, MIN_BATCH_TOKEN_BUDGET)
+    return _token_budgets[model]
+
+
+class BatchPlanner:
+    """Packs rows into batches lazily so every batch uses the budget current at dispatch time."""
+
+    def __init__(self, rows: list, user_defined_columns: list, budget: TokenBudget, max_rows: int = MAX_BATCH_ROWS,
+                 positional: bool = False):
+        self.rows = rows
+        self.costs = [estimate_row_tokens(row, user_defined_columns, positional) for row in rows]
+        self.budget = budget
+        self.max_rows = max_rows
+        self.position = 0
+
+    def next_batch(self):
+        """Return the next batch, or an empty list once every row has been handed out."""
+        start = self.position
+        used = 0
+        while self.position < len(self.rows) and self.position - start < self.max_rows:
+            cost = self.costs[self.position]
+            # A single row over budget still goes out alone rather than never
+            if used and used + cost > self.budget.current:
+                break
+            used += cost
+            self.position += 1
+        return self.rows[start:self.position]
+
+    def estimated_batches_left(self):
+        remaining = self.costs[self.position:]
+        if not remaining:
+            return 0
+        by_tokens = -(-sum(remaining) // self.budget.current)
+        by_rows = -(-len(remaining) // self.max_rows)
+        return max(by_tokens, by_rows)
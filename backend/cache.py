@@ -0,0 +1,103 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from backend.prompt import PROMPT_VERSION
+from backend.config import CACHE_ENABLED, CACHE_PATH, CACHE_TTL_SECONDS, CACHE_MAX_ENTRIES, LLM_MODEL
+
+
+def row_cache_key(row: dict, user_defined_columns: list, model: str = LLM_MODEL, schema: dict = None):
+    """Hash the source values of a row together with everything that shapes the LLM answer."""
+    # Rows enriched without a column schema keep the keys they had before schemas existed
+    parts = [row, user_defined_columns, model, PROMPT_VERSION] + ([schema] if schema else [])
+    payload = json.dumps(
+        parts,
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RowCache:
+    """On-disk SQLite cache of generated column values, keyed by row_cache_key."""
+
+    def __init__(self, path: str, ttl_seconds: int, max_entries: int, enabled: bool = True):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if self.enabled:
+            with self._connect() as conn:
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS row_cache (
+                        key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        accessed_at REAL NOT NULL
+                    )"""
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_row_cache_accessed ON row_cache (accessed_at)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get_many(self, keys: list):
+        """Return {key: generated values} for every key that is cached and not expired."""
+        if not self.enabled or not keys:
+            return {}
+        now = time.time()
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock, self._connect() as conn:
+            # SQLite limits the number of bound parameters per statement
+            for i in range(0, len(unique_keys), 500):
+                chunk = unique_keys[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT key, value FROM row_cache WHERE key IN ({placeholders}) AND created_at >= ?",
+                    (*chunk, now - self.ttl_seconds)
+                ).fetchall()
+                found.update({key: json.loads(value) for key, value in rows})
+            if found:
+                conn.executemany(
+                    "UPDATE row_cache SET accessed_at = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+        hits = sum(1 for key in keys if key in found)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return found
+
+    def set_many(self, items: dict):
+        """Store {key: generated values} and evict expired or least recently used entries."""
+        if not self.enabled or not items:
+            return
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO row_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                [(key, json.dumps(value, default=str), now, now) for key, value in items.items()]
+            )
+            conn.execute("DELETE FROM row_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            conn.execute(
+                """DELETE FROM row_cache WHERE key IN (
+                    SELECT key FROM row_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,)
+            )
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0
+        }
+
+
+row_cache = RowCache(CACHE_PATH, CACHE_TTL_SECONDS, CACHE_MAX_ENTRIES, enabled=CACHE_ENABLED)
@@ -0,0 +1,46 @@
+import json
+from fastapi.responses import JSONResponse
+from backend.config import CASCADE_MODEL, LLM_MODEL
+
+
+def cascade_models():
+    """Models tried in order: CASCADE_MODEL first when set, then LLM_MODEL for the rows it could not answer."""
+    if CASCADE_MODEL and CASCADE_MODEL != LLM_MODEL:
+        return [CASCADE_MODEL, LLM_MODEL]
+    return [LLM_MODEL]
+
+
+def parse_allowed_values(allowed_values: str = None):
+    """Parse the allowed_values form field: a JSON object of {new column: [allowed values]}.
+
+    Returns {column: set of casefolded values} or a JSONResponse describing the problem.
+    """
+    if not allowed_values:
+        return {}
+    try:
+        vocabularies = json.loads(allowed_values)
+    except json.JSONDecodeError:
+        vocabularies = None
+    if not isinstance(vocabularies, dict) or not all(isinstance(v, list) for v in vocabularies.values()):
+        return JSONResponse(
+            status_code=400,
+            content={
+                "status": "error",
+                "message": "allowed_values must be a JSON object mapping new column names to lists of values"
+            }
+        )
+    return {
+        column.strip(): {str(value).strip().casefold() for value in values}
+        for column, values in vocabularies.items()
+    }
+
+
+def needs_escalation(row: dict, user_defined_columns: list, vocabularies: dict):
+    """Whether a small-model answer is null, blank or outside its column's allowed values."""
+    for col in user_defined_columns:
+        value = row.get(col)
+        if value is None or str(value).strip() == "":
+            return True
+        if col in vocabularies and str(value).strip().casefold() not in vocabularies[col]:
+            return True
+    return False
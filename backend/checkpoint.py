@@ -0,0 +1,81 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from backend.prompt import PROMPT_VERSION
+from backend.config import CHECKPOINT_ENABLED, CHECKPOINT_PATH, CHECKPOINT_TTL_SECONDS, LLM_MODEL
+
+
+def checkpoint_run_key(contents: bytes, col_to_process: list, user_defined_columns: list, model: str = LLM_MODEL,
+                       schema: dict = None):
+    """Identify a run by the uploaded bytes and everything that shapes its answers.
+    
+    model is the model, or "+"-joined cascade chain, the run was started with;
+    schema is its column schema, since positional answers differ from untyped ones.
+    """
+    digest = hashlib.sha256(contents)
+    digest.update(
+        json.dumps([col_to_process, user_defined_columns, model, PROMPT_VERSION, schema]).encode("utf-8")
+    )
+    return digest.hexdigest()
+
+
+class CheckpointStore:
+    """Persists normalized rows of every completed batch so a failed run can resume.
+
+    Runs that succeed clear their checkpoint; rows older than ttl_seconds, left by
+    runs that failed and were never retried, are purged as new batches are saved.
+    """
+
+    def __init__(self, path: str, ttl_seconds: int, enabled: bool = True):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        if self.enabled:
+            with self._connect() as conn:
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS checkpoints (
+                        run_key TEXT NOT NULL,
+                        row_id INTEGER NOT NULL,
+                        value TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        PRIMARY KEY (run_key, row_id)
+                    )"""
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_checkpoints_created ON checkpoints (created_at)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def load(self, run_key: str):
+        """Return {__row_id__: normalized row} for every row already completed in this run."""
+        if not self.enabled or not run_key:
+            return {}
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT row_id, value FROM checkpoints WHERE run_key = ?", (run_key,)
+            ).fetchall()
+        return {row_id: json.loads(value) for row_id, value in rows}
+
+    def save(self, run_key: str, normalized_rows: list):
+        if not self.enabled or not run_key or not normalized_rows:
+            return
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO checkpoints (run_key, row_id, value, created_at) VALUES (?, ?, ?, ?)",
+                [(run_key, r["__row_id__"], json.dumps(r, default=str), now) for r in normalized_rows]
+            )
+            conn.execute("DELETE FROM checkpoints WHERE created_at < ?", (now - self.ttl_seconds,))
+
+    def clear(self, run_key: str):
+        """Drop the checkpoint once the run has completed."""
+        if not self.enabled or not run_key:
+            return
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM checkpoints WHERE run_key = ?", (run_key,))
+
+
+checkpoint_store = CheckpointStore(CHECKPOINT_PATH, CHECKPOINT_TTL_SECONDS, enabled=CHECKPOINT_ENABLED)
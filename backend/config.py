@@ -1,17 +1,97 @@
 import os 
 from dotenv import load_dotenv
-from groq import Groq
 
 load_dotenv()
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    raise ValueError("GROQ_API_KEY environment variable is not set")
+# Optional comma-separated list of keys to spread load across
+GROQ_API_KEYS = [key.strip() for key in os.getenv("GROQ_API_KEYS", "").split(",") if key.strip()]
+if not GROQ_API_KEYS and GROQ_API_KEY:
+    GROQ_API_KEYS = [GROQ_API_KEY]
+# Point the client at another chat-completions server, e.g. the benchmark mock
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL")
+
+# "groq" uses the Groq SDK; "openai" talks to any OpenAI-compatible {LLM_BASE_URL}/chat/completions
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq").lower()
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or GROQ_BASE_URL
+# Keys for the provider; falls back to the Groq keys
+LLM_API_KEYS = [key.strip() for key in os.getenv("LLM_API_KEYS", "").split(",") if key.strip()] or GROQ_API_KEYS
+
+# Keep-alive connection pool shared by all provider clients
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "30"))
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "10"))
+HTTP_READ_TIMEOUT_SECONDS = float(os.getenv("HTTP_READ_TIMEOUT_SECONDS", "120"))
 
 BATCH_SIZE = int(os.getenv("BATCH_SIZE", "50"))
 MAX_FILE_SIZE_MB = int(os.getenv("MAX_FILE_SIZE_MB", "10"))
 MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
+# Limit for the previous enriched output of an incremental run, which is larger than its input
+PREVIOUS_MAX_FILE_SIZE_MB = int(os.getenv("PREVIOUS_MAX_FILE_SIZE_MB", str(MAX_FILE_SIZE_MB * 4)))
 LLM_MODEL = os.getenv("LLM_MODEL", "llama-3.3-70b-versatile")
+MAX_CONCURRENT_BATCHES = int(os.getenv("MAX_CONCURRENT_BATCHES", "5"))
+FALLBACK_MODEL = os.getenv("FALLBACK_MODEL")
+# Ask the provider for JSON mode (response_format json_object) when a column_schema switches to positional output.
+# Off by default: the request is streamed, which not every provider supports together with JSON mode
+LLM_JSON_MODE = os.getenv("LLM_JSON_MODE", "false").lower() == "true"
+# Small model that answers every row first; only null, off-vocabulary or malformed rows go on to LLM_MODEL
+CASCADE_MODEL = os.getenv("CASCADE_MODEL")
+# Per key and model; 0 disables pacing for that dimension
+RATE_LIMIT_RPM = int(os.getenv("RATE_LIMIT_RPM", "0"))
+RATE_LIMIT_TPM = int(os.getenv("RATE_LIMIT_TPM", "0"))
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "8"))
+RATE_LIMIT_DEFAULT_RETRY_AFTER = float(os.getenv("RATE_LIMIT_DEFAULT_RETRY_AFTER", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BACKOFF_SECONDS = float(os.getenv("LLM_RETRY_BACKOFF_SECONDS", "1"))
+
+BATCH_TOKEN_BUDGET = int(os.getenv("BATCH_TOKEN_BUDGET", "6000"))
+MIN_BATCH_TOKEN_BUDGET = int(os.getenv("MIN_BATCH_TOKEN_BUDGET", "500"))
+# Per-model overrides, e.g. "llama-3.3-70b-versatile=6000,llama-3.1-8b-instant=3000"
+MODEL_TOKEN_BUDGETS = {
+    model.strip(): int(budget)
+    for model, budget in (
+        item.split("=", 1) for item in os.getenv("MODEL_TOKEN_BUDGETS", "").split(",") if "=" in item
+    )
+}
+MAX_BATCH_ROWS = int(os.getenv("MAX_BATCH_ROWS", "200"))
+CHARS_PER_TOKEN = int(os.getenv("CHARS_PER_TOKEN", "4"))
+EXPECTED_VALUE_CHARS = int(os.getenv("EXPECTED_VALUE_CHARS", "16"))
+
+DERIVED_SAMPLE_ROWS = int(os.getenv("DERIVED_SAMPLE_ROWS", "5"))
+
+# Upper bound for preview_rows on /upload_file
+PREVIEW_MAX_ROWS = int(os.getenv("PREVIEW_MAX_ROWS", "500"))
+
+# Files accepted by one /upload_files request, counting the files inside zips
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", "100"))
+# Combined size of those files once unzipped
+BULK_MAX_TOTAL_MB = int(os.getenv("BULK_MAX_TOTAL_MB", "100"))
+BULK_MAX_TOTAL_BYTES = BULK_MAX_TOTAL_MB * 1024 * 1024
+
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", str(BATCH_SIZE * MAX_CONCURRENT_BATCHES)))
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOBS_DIR = os.getenv("JOBS_DIR", "jobs")
+
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+CACHE_PATH = os.getenv("CACHE_PATH", "enrichment_cache.sqlite3")
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", str(30 * 24 * 60 * 60)))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1000000"))
+
+LOOKUP_ENABLED = os.getenv("LOOKUP_ENABLED", "true").lower() == "true"
+LOOKUP_PATH = os.getenv("LOOKUP_PATH", "lookup_index.sqlite3")
+# Exporting and importing lookup entries require this value in the X-Admin-Token header;
+# both endpoints answer 403 while it is unset
+LOOKUP_ADMIN_TOKEN = os.getenv("LOOKUP_ADMIN_TOKEN")
+
+CHECKPOINT_ENABLED = os.getenv("CHECKPOINT_ENABLED", "true").lower() == "true"
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", "enrichment_checkpoints.sqlite3")
+# Checkpoints of runs that were never retried are purged after this long
+CHECKPOINT_TTL_SECONDS = int(os.getenv("CHECKPOINT_TTL_SECONDS", str(7 * 24 * 60 * 60)))
 
+# How long the final progress event of an upload or job stays available to /progress subscribers
+PROGRESS_RETENTION_SECONDS = int(os.getenv("PROGRESS_RETENTION_SECONDS", "300"))
 
-client = Groq(api_key=GROQ_API_KEY)
\ No newline at end of file
+# Adds a Server-Timing header with per-stage durations to every response
+TIMING_HEADER_ENABLED = os.getenv("TIMING_HEADER_ENABLED", "false").lower() == "true"
@@ -0,0 +1,327 @@
+import ast
+import json
+import operator
+import re
+import numpy as np
+import pandas as pd
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from backend.prompt import DERIVED_EXPRESSION_PROMPT
+from backend.scheduler import scheduler, retry_after_seconds
+from backend.providers import ProviderRateLimitError
+from backend.config import DERIVED_SAMPLE_ROWS
+
+
+class ExpressionError(ValueError):
+    """Raised when a derived column expression is invalid for the given frame."""
+
+
+# Expressions are user input: keep constant arithmetic from building huge Python
+# integers or strings, which would block the worker evaluating them
+MAX_EXPONENT = 64
+MAX_INTEGER_BITS = 4096
+MAX_TEXT_LENGTH = 10_000
+
+
+_BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+
+_COMPARE_OPERATORS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+
+
+def _truthy(values: pd.Series):
+    """Python truthiness per row: non-zero numbers, non-empty text, True; missing values are False."""
+    if pd.api.types.is_bool_dtype(values):
+        return values.fillna(False).astype(bool)
+    if pd.api.types.is_numeric_dtype(values):
+        return values.fillna(0).ne(0).astype(bool)
+    return _text(values).fillna("").str.len().gt(0).astype(bool)
+
+
+def _text(value):
+    if isinstance(value, pd.Series):
+        return value.astype("string")
+    return pd.Series([value], dtype="string").iloc[0]
+
+
+def _dates(value):
+    return pd.to_datetime(value, errors="coerce")
+
+
+def _is_text(value):
+    return isinstance(value, (str, bytes)) or (isinstance(value, pd.Series) and pd.api.types.is_string_dtype(value))
+
+
+def _longest(value):
+    """Length of value as text, or of its longest row for a Series."""
+    if isinstance(value, pd.Series):
+        return _largest(_text(value).str.len())
+    return len(value) if isinstance(value, (str, bytes)) else len(str(value))
+
+
+def _largest(values: pd.Series):
+    return int(values.max()) if values.notna().any() else 0
+
+
+def _check_length(length: int):
+    if length > MAX_TEXT_LENGTH:
+        raise ExpressionError(f"Text values can be at most {MAX_TEXT_LENGTH} characters long")
+
+
+def _concat(*parts):
+    _check_length(sum(_longest(part) for part in parts))
+    result = _text(parts[0])
+    for part in parts[1:]:
+        result = result + _text(part)
+    return result
+
+
+def _if_else(condition, when_true, when_false):
+    if not isinstance(condition, pd.Series):
+        return when_true if condition else when_false
+    when_true = when_true if isinstance(when_true, pd.Series) else pd.Series(when_true, index=condition.index)
+    return when_true.where(_truthy(condition), when_false)
+
+
+def _replace(values, old, new):
+    text = _text(values)
+    if isinstance(old, str) and isinstance(new, str) and len(new) > len(old):
+        # Every occurrence grows the value by the difference; an empty old matches between all characters
+        count = text.str.count(re.escape(old)) if old else text.str.len() + 1
+        _check_length(_largest(text.str.len() + count * (len(new) - len(old))))
+    return text.str.replace(old, new, regex=False)
+
+
+def _map(values, mapping, default=None):
+    mapped = values.map(mapping)
+    return mapped if default is None else mapped.fillna(default)
+
+
+def _coalesce(*values):
+    result = values[0]
+    for value in values[1:]:
+        result = result.combine_first(value) if isinstance(result, pd.Series) else result
+    return result
+
+
+FUNCTIONS = {
+    "upper": lambda s: _text(s).str.upper(),
+    "lower": lambda s: _text(s).str.lower(),
+    "title": lambda s: _text(s).str.title(),
+    "strip": lambda s: _text(s).str.strip(),
+    "length": lambda s: _text(s).str.len(),
+    "concat": _concat,
+    "substr": lambda s, start, length=None: _text(s).str.slice(start, None if length is None else start + length),
+    "replace": _replace,
+    "contains": lambda s, pattern: _text(s).str.contains(pattern, case=False, regex=False),
+    "to_number": lambda s: pd.to_numeric(s, errors="coerce"),
+    "to_date": _dates,
+    "year": lambda s: _dates(s).dt.year,
+    "month": lambda s: _dates(s).dt.month,
+    "day": lambda s: _dates(s).dt.day,
+    "days_between": lambda start, end: (_dates(end) - _dates(start)).dt.days,
+    "round": lambda s, digits=0: s.round(digits),
+    "abs": lambda s: s.abs(),
+    "if_else": _if_else,
+    "map": _map,
+    "coalesce": _coalesce,
+}
+
+
+def _check_size(op: ast.operator, left, right):
+    """Reject powers, repetitions and joins whose result would be too large to compute quickly."""
+    if isinstance(op, ast.Pow):
+        if isinstance(right, pd.Series) or not isinstance(right, (int, float)) or abs(right) > MAX_EXPONENT:
+            raise ExpressionError(f"Exponents must be constants between -{MAX_EXPONENT} and {MAX_EXPONENT}")
+        if isinstance(left, int) and isinstance(right, int) and left.bit_length() * right > MAX_INTEGER_BITS:
+            raise ExpressionError("Constant power is too large")
+    if isinstance(op, ast.Mod) and _is_text(left):
+        # printf-style formatting can pad a value to any width
+        raise ExpressionError("% is not supported on text")
+    if isinstance(op, ast.Add) and _is_text(left) and _is_text(right):
+        _check_length(_longest(left) + _longest(right))
+    if isinstance(op, ast.Mult):
+        for value, count in ((left, right), (right, left)):
+            if not _is_text(value):
+                continue
+            # Text may only be repeated a constant number of times, up to the length limit
+            if isinstance(count, pd.Series):
+                raise ExpressionError("Text can only be repeated a constant number of times")
+            if isinstance(count, int):
+                _check_length(_longest(value) * count)
+        if isinstance(left, int) and isinstance(right, int) and left.bit_length() + right.bit_length() > MAX_INTEGER_BITS:
+            raise ExpressionError("Constant product is too large")
+
+
+def _evaluate(node, df: pd.DataFrame):
+    if isinstance(node, ast.Expression):
+        return _evaluate(node.body, df)
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.Name):
+        if node.id not in df.columns:
+            raise ExpressionError(f"Unknown column '{node.id}'")
+        return df[node.id]
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+        left, right = _evaluate(node.left, df), _evaluate(node.right, df)
+        _check_size(node.op, left, right)
+        return _BINARY_OPERATORS[type(node.op)](left, right)
+    if isinstance(node, ast.UnaryOp):
+        operand = _evaluate(node.operand, df)
+        if isinstance(node.op, ast.USub):
+            return -operand
+        if isinstance(node.op, ast.Not):
+            return ~_truthy(operand) if isinstance(operand, pd.Series) else not operand
+    if isinstance(node, ast.BoolOp):
+        values = [_truthy(value) if isinstance(value, pd.Series) else bool(value)
+                  for value in (_evaluate(value, df) for value in node.values)]
+        combine = operator.and_ if isinstance(node.op, ast.And) else operator.or_
+        result = values[0]
+        for value in values[1:]:
+            result = combine(result, value)
+        return result
+    if isinstance(node, ast.Compare):
+        left = _evaluate(node.left, df)
+        result = None
+        for op, comparator in zip(node.ops, node.comparators):
+            if type(op) not in _COMPARE_OPERATORS:
+                raise ExpressionError("Unsupported comparison")
+            right = _evaluate(comparator, df)
+            current = _COMPARE_OPERATORS[type(op)](left, right)
+            result = current if result is None else result & current
+            left = right
+        return result
+    if isinstance(node, ast.Dict):
+        return {_evaluate(key, df): _evaluate(value, df) for key, value in zip(node.keys, node.values)}
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+        # col("unit price") reads columns whose names are not valid identifiers
+        if node.func.id == "col" and len(node.args) == 1 and isinstance(node.args[0], ast.Constant):
+            name = node.args[0].value
+            if name not in df.columns:
+                raise ExpressionError(f"Unknown column '{name}'")
+            return df[name]
+        if node.func.id in FUNCTIONS:
+            args = [_evaluate(arg, df) for arg in node.args]
+            return FUNCTIONS[node.func.id](*args)
+        raise ExpressionError(f"Unknown function '{node.func.id}'")
+    raise ExpressionError(f"Unsupported expression: {ast.dump(node)[:60]}")
+
+
+def evaluate_expression(expression: str, df: pd.DataFrame):
+    """Evaluate a derived column expression over the whole frame at once."""
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except SyntaxError:
+        raise ExpressionError(f"Invalid expression: {expression}")
+    try:
+        result = _evaluate(tree, df)
+    except ExpressionError:
+        raise
+    except Exception as e:
+        raise ExpressionError(f"Expression '{expression}' failed: {e}")
+    if not isinstance(result, pd.Series):
+        result = pd.Series(result, index=df.index)
+    if pd.api.types.is_float_dtype(result):
+        result = result.replace([np.inf, -np.inf], np.nan)
+    return result
+
+
+def parse_derived_columns(derived_columns: str = None):
+    """Parse the derived_columns form field: a JSON object of {new column: expression}.
+
+    An empty expression asks the model to write one from a sample of rows.
+    Returns the dict or a JSONResponse describing the problem.
+    """
+    if not derived_columns:
+        return {}
+    try:
+        specs = json.loads(derived_columns)
+    except json.JSONDecodeError:
+        specs = None
+    if not isinstance(specs, dict) or not all(isinstance(v, (str, type(None))) for v in specs.values()):
+        return JSONResponse(
+            status_code=400,
+            content={
+                "status": "error",
+                "message": "derived_columns must be a JSON object mapping new column names to expressions"
+            }
+        )
+    return {name.strip(): (expression or "").strip() for name, expression in specs.items()}
+
+
+async def generate_expression(column: str, sample: pd.DataFrame):
+    """Ask the model once for an expression computing column from the sample rows, or None."""
+    prompt = DERIVED_EXPRESSION_PROMPT.format(
+        column=column,
+        functions=", ".join(sorted(FUNCTIONS)),
+        columns=json.dumps(sample.columns.tolist(), ensure_ascii=False),
+        rows=sample.to_json(orient="values", date_format="iso", force_ascii=False)
+    )
+    lane = await scheduler.acquire(len(prompt) // 4)
+    try:
+        content = await lane.provider.complete(lane.model, [{"role": "user", "content": prompt}])
+    except ProviderRateLimitError as e:
+        # Not worth waiting for: the column is generated row by row instead
+        lane.block(retry_after_seconds(e))
+        return None
+    expression = content.replace("```", "").strip()
+    if not expression or expression.upper() == "NONE":
+        return None
+    try:
+        await run_in_threadpool(evaluate_expression, expression, sample)
+    except ExpressionError:
+        return None
+    return expression
+
+
+async def resolve_derived_expressions(df: pd.DataFrame, specs: dict):
+    """Fill in model-written expressions for specs without one.
+
+    Returns (expressions, unresolved) where unresolved columns could not be
+    expressed locally and should be generated by the LLM row by row instead,
+    or a JSONResponse when a user-supplied expression is invalid.
+    """
+    expressions = {}
+    unresolved = []
+    sample = df.head(DERIVED_SAMPLE_ROWS)
+    for column, expression in specs.items():
+        if expression:
+            try:
+                await run_in_threadpool(evaluate_expression, expression, sample)
+            except ExpressionError as e:
+                return JSONResponse(
+                    status_code=400,
+                    content={"status": "error", "message": f"Derived column '{column}': {e}"}
+                )
+        else:
+            expression = await generate_expression(column, sample)
+        if expression:
+            expressions[column] = expression
+        else:
+            unresolved.append(column)
+    return expressions, unresolved
+
+
+def apply_derived_columns(df: pd.DataFrame, expressions: dict):
+    """Compute every derived column vectorized; returns a frame with one column per expression.
+    
+    Evaluation is CPU-bound, so async callers run this in the threadpool.
+    """
+    return pd.DataFrame(
+        {column: evaluate_expression(expression, df) for column, expression in expressions.items()},
+        index=df.index
+    )
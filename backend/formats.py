@@ -0,0 +1,155 @@
+import io
+import os
+import zipfile
+import pyarrow as pa
+import pandas as pd
+
+# Leading bytes of every supported binary input
+MAGIC_BYTES = {
+    b"PAR1": "parquet",
+    b"ARROW1": "arrow",
+    b"\xff\xff\xff\xff": "arrow_stream",
+    b"\x1f\x8b": "gzip",
+    b"\x28\xb5\x2f\xfd": "zstd",
+}
+
+ZIP_MAGIC = b"PK\x03\x04"
+
+# Compressed input is inflated in pieces of this size so oversized payloads are caught early
+INFLATE_CHUNK_BYTES = 1024 * 1024
+
+# output_format -> (media type, file extension)
+OUTPUT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "csv.gz": ("application/gzip", "csv.gz"),
+    "csv.zst": ("application/zstd", "csv.zst"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+class PayloadTooLargeError(ValueError):
+    """Raised when an upload is larger than allowed once decompressed."""
+
+
+def detect_input_format(contents: bytes):
+    """Name the format of an upload from its first bytes: parquet, arrow, arrow_stream, gzip, zstd, jsonl or csv."""
+    for magic, name in MAGIC_BYTES.items():
+        if contents.startswith(magic):
+            return name
+    if contents.lstrip()[:1] == b"{":
+        return "jsonl"
+    return "csv"
+
+
+def _inflate(contents: bytes, compression: str, max_bytes: int = None):
+    stream = pa.input_stream(pa.py_buffer(contents), compression=compression)
+    chunks = []
+    total = 0
+    while True:
+        chunk = stream.read(INFLATE_CHUNK_BYTES)
+        if not chunk:
+            return b"".join(chunks)
+        total += len(chunk)
+        if max_bytes is not None and total > max_bytes:
+            raise PayloadTooLargeError("The file exceeds the maximum allowed size once decompressed")
+        chunks.append(chunk)
+
+
+def decompress(contents: bytes, max_bytes: int = None):
+    """Undo gzip or zstd compression, returning the payload and its detected format.
+    
+    Raises PayloadTooLargeError as soon as the payload inflates past max_bytes.
+    """
+    input_format = detect_input_format(contents)
+    if input_format in ("gzip", "zstd"):
+        contents = _inflate(contents, input_format, max_bytes)
+        input_format = detect_input_format(contents)
+    return contents, input_format
+
+
+def read_frame(contents: bytes, input_format: str):
+    """Parse decompressed contents into an Arrow-backed DataFrame."""
+    if input_format == "parquet":
+        return pd.read_parquet(io.BytesIO(contents), dtype_backend="pyarrow")
+    if input_format in ("arrow", "arrow_stream"):
+        open_reader = pa.ipc.open_file if input_format == "arrow" else pa.ipc.open_stream
+        return open_reader(pa.py_buffer(contents)).read_all().to_pandas(types_mapper=pd.ArrowDtype)
+    if input_format == "jsonl":
+        return pd.read_json(io.BytesIO(contents), lines=True, engine="pyarrow", dtype_backend="pyarrow")
+    return pd.read_csv(io.BytesIO(contents), engine="pyarrow", dtype_backend="pyarrow", encoding="utf-8")
+
+
+def serialize_frame(df: pd.DataFrame, output_format: str):
+    """Encode an enriched frame as CSV, gzip/zstd-compressed CSV or Parquet bytes."""
+    if output_format == "parquet":
+        # Model answers can mix strings and numbers in one column, which Parquet cannot store
+        object_columns = df.select_dtypes(include="object").columns
+        buffer = io.BytesIO()
+        df.astype({col: "string" for col in object_columns}).to_parquet(buffer, index=False)
+        return buffer.getvalue()
+    csv_bytes = df.to_csv(index=False).encode("utf-8")
+    if output_format == "csv":
+        return csv_bytes
+    sink = pa.BufferOutputStream()
+    with pa.output_stream(sink, compression="gzip" if output_format == "csv.gz" else "zstd") as out:
+        out.write(csv_bytes)
+    return sink.getvalue().to_pybytes()
+
+
+def expand_archives(uploads: list, max_entry_bytes: int, max_files: int, max_total_bytes: int):
+    """Replace every zip in a list of (filename, bytes) uploads with the files it contains.
+    
+    Directories, hidden files and macOS resource forks are skipped. Raises
+    ValueError as soon as there are more than max_files files, one of them
+    unpacks to more than max_entry_bytes, or all of them together to more
+    than max_total_bytes; entries are never inflated past those limits.
+    """
+    files = []
+    total = 0
+    
+    def add(name: str, contents: bytes):
+        nonlocal total
+        total += len(contents)
+        if len(files) == max_files:
+            raise ValueError(f"At most {max_files} files can be processed at once")
+        if total > max_total_bytes:
+            raise ValueError("The files are larger than the maximum allowed total size")
+        files.append((name, contents))
+    
+    for filename, contents in uploads:
+        if not contents.startswith(ZIP_MAGIC):
+            add(filename, contents)
+            continue
+        with zipfile.ZipFile(io.BytesIO(contents)) as archive:
+            for info in archive.infolist():
+                name = os.path.basename(info.filename)
+                if info.is_dir() or not name or name.startswith(".") or info.filename.startswith("__MACOSX/"):
+                    continue
+                if len(files) == max_files:
+                    raise ValueError(f"At most {max_files} files can be processed at once")
+                # Declared sizes can lie, so read at most one byte past what is still allowed
+                limit = min(max_entry_bytes, max_total_bytes - total)
+                with archive.open(info) as entry:
+                    data = entry.read(limit + 1)
+                if len(data) > max_entry_bytes:
+                    raise ValueError(f"{info.filename} is larger than the maximum allowed size")
+                add(name, data)
+    return files
+
+
+def zip_outputs(outputs: list, output_format: str):
+    """Pack (filename, bytes) outputs into one zip, naming each after its input with the output extension."""
+    extension = OUTPUT_FORMATS[output_format][1]
+    # Already compressed outputs are stored as they are
+    compression = zipfile.ZIP_DEFLATED if output_format == "csv" else zipfile.ZIP_STORED
+    buffer = io.BytesIO()
+    used = set()
+    with zipfile.ZipFile(buffer, "w", compression=compression) as archive:
+        for index, (filename, contents) in enumerate(outputs):
+            stem = os.path.basename(filename or "").split(".")[0] or f"file{index + 1}"
+            name = f"{stem}.{extension}"
+            if name in used:
+                name = f"{stem}_{index + 1}.{extension}"
+            used.add(name)
+            archive.writestr(name, contents)
+    return buffer.getvalue()
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+
+def row_hashes(df: pd.DataFrame, col_to_process: list):
+    """64-bit content hash of each row's source values.
+
+    Values are hashed as strings so an upload and a previous output read from
+    different formats (CSV, Parquet) still hash alike.
+    """
+    return pd.util.hash_pandas_object(df[col_to_process].astype("string"), index=False).to_numpy()
+
+
+def match_previous(df: pd.DataFrame, previous: pd.DataFrame, col_to_process: list, user_defined_columns: list):
+    """Find the rows of df whose source values are unchanged since the previous enriched output.
+
+    Returns (matched, reused, extra_columns): a boolean array marking the rows
+    found in previous, {column: object array} with the previous values of every
+    new column previous already has, and the new columns previous lacks, which
+    still have to be generated for every row. reused holds None for unmatched
+    rows and for null or blank previous values, so rows that failed last time
+    are generated again.
+    """
+    reusable = [col for col in user_defined_columns if col in previous.columns]
+    extra_columns = [col for col in user_defined_columns if col not in previous.columns]
+
+    # Rows repeated in previous share a hash; their first occurrence supplies the values
+    previous_hashes = pd.Index(row_hashes(previous, col_to_process))
+    first = ~previous_hashes.duplicated()
+    positions = previous_hashes[first].get_indexer(row_hashes(df, col_to_process))
+    matched = positions >= 0
+
+    reused = {}
+    for col in reusable:
+        values = previous[col][first]
+        blank = values.astype("string").str.strip().fillna("").eq("").to_numpy()
+        values = np.where(blank, None, values.astype(object).to_numpy())
+        column = np.full(len(df), None, dtype=object)
+        column[matched] = values[positions[matched]]
+        reused[col] = column
+    return matched, reused, extra_columns
@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import threading
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from backend.services import process_csv
+from backend.formats import OUTPUT_FORMATS, serialize_frame
+from backend.progress import progress_hub
+from backend.metrics import stage, JOB_QUEUE_DEPTH
+from backend.config import JOB_WORKERS, JOBS_DIR
+
+
+def _read_file(path: str):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _write_file(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+class JobStore:
+    """SQLite-backed job state so queued and finished jobs survive a restart.
+
+    Every method blocks on SQLite or the filesystem; async callers run them in the threadpool.
+    """
+
+    OPTIONAL_COLUMNS = {"derived_columns": "TEXT", "output_format": "TEXT", "allowed_values": "TEXT", "stats": "TEXT",
+                        "column_schema": "TEXT"}
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "jobs.sqlite3")
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    status TEXT,
+                    message TEXT,
+                    columns TEXT,
+                    new_columns TEXT,
+                    derived_columns TEXT,
+                    output_format TEXT,
+                    allowed_values TEXT,
+                    column_schema TEXT,
+                    stats TEXT,
+                    batches_done INTEGER NOT NULL DEFAULT 0,
+                    batches_total INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            # Add columns introduced after the table was first created
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for name, definition in self.OPTIONAL_COLUMNS.items():
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {definition}")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def upload_path(self, job_id: str):
+        # Raw upload in whichever input format it arrived; the name predates other formats
+        return os.path.join(self.directory, f"{job_id}.upload.csv")
+
+    def previous_path(self, job_id: str):
+        # Earlier enriched output for incremental jobs
+        return os.path.join(self.directory, f"{job_id}.previous")
+
+    def result_path(self, job_id: str, output_format: str = "csv"):
+        return os.path.join(self.directory, f"{job_id}.result.{OUTPUT_FORMATS[output_format][1]}")
+
+    def create(self, contents: bytes, columns: str = None, new_columns: str = None, derived_columns: str = None,
+               output_format: str = "csv", allowed_values: str = None, column_schema: str = None,
+               previous: bytes = None):
+        job_id = uuid.uuid4().hex
+        _write_file(self.upload_path(job_id), contents)
+        if previous is not None:
+            _write_file(self.previous_path(job_id), previous)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                """INSERT INTO jobs (id, state, columns, new_columns, derived_columns, output_format, allowed_values,
+                column_schema, created_at, updated_at)
+                VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (job_id, columns, new_columns, derived_columns, output_format, allowed_values, column_schema, now, now)
+            )
+        return job_id
+
+    def update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id: str):
+        with self._lock, self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def unfinished(self):
+        """Ids of jobs that were queued or running when the server last stopped."""
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id FROM jobs WHERE state IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def read_upload(self, job_id: str):
+        """The job's upload and its previous output (None for non-incremental jobs)."""
+        previous_path = self.previous_path(job_id)
+        previous = _read_file(previous_path) if os.path.exists(previous_path) else None
+        return _read_file(self.upload_path(job_id)), previous
+
+    def read_result(self, job_id: str, output_format: str = "csv"):
+        return _read_file(self.result_path(job_id, output_format))
+
+    def save_result(self, job_id: str, output_format: str, output: bytes):
+        """Write the result file and drop the job's inputs, which are no longer needed."""
+        _write_file(self.result_path(job_id, output_format), output)
+        for path in (self.upload_path(job_id), self.previous_path(job_id)):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class JobManager:
+    """Runs queued jobs through process_csv on a fixed pool of background workers."""
+
+    def __init__(self, store: JobStore, workers: int):
+        self.store = store
+        self.workers = workers
+        self.queue = asyncio.Queue()
+        self._tasks = []
+
+    async def start(self):
+        for job_id in await run_in_threadpool(self.store.unfinished):
+            await run_in_threadpool(self.store.update, job_id, state="queued", batches_done=0)
+            self.queue.put_nowait(job_id)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, contents: bytes, columns: str = None, new_columns: str = None,
+                     derived_columns: str = None, output_format: str = "csv", allowed_values: str = None,
+                     column_schema: str = None, previous: bytes = None):
+        job_id = await run_in_threadpool(
+            self.store.create, contents, columns, new_columns, derived_columns, output_format, allowed_values,
+            column_schema, previous
+        )
+        self.queue.put_nowait(job_id)
+        return job_id
+
+    async def _worker(self):
+        while True:
+            job_id = await self.queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                await run_in_threadpool(
+                    self.store.update, job_id, state="failed", status="error", message="Internal server error"
+                )
+                progress_hub.finish(job_id, "failed", "Internal server error")
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job_id: str):
+        job = await run_in_threadpool(self.store.get, job_id)
+        await run_in_threadpool(self.store.update, job_id, state="running")
+        contents, previous = await run_in_threadpool(self.store.read_upload, job_id)
+
+        # Progress arrives on the event loop once per batch; one writer task at a time
+        # stores the latest counts in the threadpool, skipping events it falls behind on
+        pending = {}
+        writer = None
+
+        async def write_progress():
+            while pending:
+                fields = pending.copy()
+                pending.clear()
+                await run_in_threadpool(self.store.update, job_id, **fields)
+
+        def progress(event):
+            nonlocal writer
+            progress_hub.publish(job_id, event)
+            pending.update(batches_done=event["batches_done"], batches_total=event["batches_total"])
+            if writer is None or writer.done():
+                writer = asyncio.ensure_future(write_progress())
+
+        try:
+            result = await process_csv(
+                contents, job["columns"], job["new_columns"], progress, job["derived_columns"], job["allowed_values"],
+                job["column_schema"], previous
+            )
+        finally:
+            if writer is not None:
+                await writer
+        if isinstance(result, JSONResponse):
+            body = json.loads(result.body)
+            await run_in_threadpool(
+                self.store.update, job_id, state="failed", status="error", message=body.get("message")
+            )
+            progress_hub.finish(job_id, "failed", body.get("message"))
+            return
+
+        if not result["generated_anything"]:
+            status, message = "no_change", "CSV processed successfully, but no new values could be generated."
+        elif result["partial_enrichment"]:
+            status, message = "success", "CSV processed successfully with partial enrichment."
+        else:
+            status, message = "success", "CSV processed successfully."
+        output_format = job["output_format"] or "csv"
+        with stage("serialize"):
+            output = await run_in_threadpool(serialize_frame, result["updated_df"], output_format)
+        await run_in_threadpool(self.store.save_result, job_id, output_format, output)
+        await run_in_threadpool(
+            self.store.update, job_id, state="done", status=status, message=message, stats=json.dumps(result["stats"])
+        )
+        progress_hub.finish(job_id, "done", message)
+
+
+job_manager = JobManager(JobStore(JOBS_DIR), JOB_WORKERS)
+JOB_QUEUE_DEPTH.set_function(job_manager.queue.qsize)
@@ -0,0 +1,68 @@
+import json
+
+
+class JsonArrayStreamParser:
+    """Incrementally parses a streamed top-level JSON array of objects.
+
+    feed() takes the next piece of model output and returns every object whose
+    closing brace has arrived, so a truncated response still yields all the
+    objects completed before it was cut off. Text before the opening '[' (code
+    fences, labels) is skipped and objects that fail to decode are dropped.
+    With item_type=list the items are arrays instead, e.g. the rows of a
+    positional {"rows": [[...], ...]} response.
+    """
+
+    def __init__(self, item_type: type = dict):
+        self.item_type = item_type
+        self.buffer = []
+        self.started = False
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.errors = 0
+
+    def feed(self, text: str):
+        objects = []
+        for char in text:
+            if not self.started:
+                if char == "[":
+                    self.started = True
+                    self.depth = 1
+                continue
+
+            if self.depth > 1:
+                self.buffer.append(char)
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                continue
+
+            if char == '"':
+                self.in_string = True
+            elif char in "[{":
+                self.depth += 1
+                if self.depth == 2:
+                    self.buffer = [char]
+            elif char in "]}":
+                self.depth -= 1
+                if self.depth == 1:
+                    objects.extend(self._flush())
+        return objects
+
+    def _flush(self):
+        text = "".join(self.buffer)
+        self.buffer = []
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError:
+            self.errors += 1
+            return []
+        if not isinstance(value, self.item_type):
+            self.errors += 1
+            return []
+        return [value]
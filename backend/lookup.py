@@ -0,0 +1,135 @@
+import json
+import time
+import sqlite3
+import threading
+import pandas as pd
+from backend.config import LOOKUP_ENABLED, LOOKUP_PATH
+
+
+def normalize_lookup_values(values: pd.Series):
+    """Lookup keys ignore surrounding whitespace and case, e.g. ' Paris' and 'paris'."""
+    return values.astype(str).str.strip().str.casefold()
+
+
+class LookupIndex:
+    """Persistent (source column, new column, source value) -> output dictionary.
+
+    Harvested from model answers for single-source-column requests, so recurring
+    values like city -> country resolve locally. Pinned entries are set by admins
+    and are never overwritten by harvesting.
+    """
+
+    def __init__(self, path: str, enabled: bool = True):
+        self.path = path
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        if self.enabled:
+            with self._connect() as conn:
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS lookup_index (
+                        source_column TEXT NOT NULL,
+                        new_column TEXT NOT NULL,
+                        source_value TEXT NOT NULL,
+                        output TEXT NOT NULL,
+                        pinned INTEGER NOT NULL DEFAULT 0,
+                        updated_at REAL NOT NULL,
+                        PRIMARY KEY (source_column, new_column, source_value)
+                    ) WITHOUT ROWID"""
+                )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get_mappings(self, source_column: str, new_columns: list, source_values: list):
+        """Return {new column: {normalized source value: output}} for the known values."""
+        mappings = {col: {} for col in new_columns}
+        if not self.enabled or not source_values or not new_columns:
+            return mappings
+        with self._lock, self._connect() as conn:
+            for col in new_columns:
+                # SQLite limits the number of bound parameters per statement
+                for i in range(0, len(source_values), 500):
+                    chunk = source_values[i:i + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows = conn.execute(
+                        f"""SELECT source_value, output FROM lookup_index
+                        WHERE source_column = ? AND new_column = ? AND source_value IN ({placeholders})""",
+                        (source_column, col, *chunk)
+                    ).fetchall()
+                    mappings[col].update({value: json.loads(output) for value, output in rows})
+        return mappings
+
+    def harvest(self, source_column: str, answers: dict):
+        """Store {normalized source value: {new column: output}} from model answers, skipping nulls."""
+        if not self.enabled:
+            return
+        now = time.time()
+        entries = [
+            (source_column, col, value, json.dumps(output, default=str), now)
+            for value, outputs in answers.items()
+            for col, output in outputs.items()
+            if output is not None and output != ""
+        ]
+        if not entries:
+            return
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                """INSERT INTO lookup_index (source_column, new_column, source_value, output, pinned, updated_at)
+                VALUES (?, ?, ?, ?, 0, ?)
+                ON CONFLICT (source_column, new_column, source_value)
+                DO UPDATE SET output = excluded.output, updated_at = excluded.updated_at
+                WHERE pinned = 0""",
+                entries
+            )
+
+    def import_entries(self, entries: list):
+        """Seed or pin mappings; imported entries replace existing ones, pinned or not."""
+        if not self.enabled:
+            return 0
+        now = time.time()
+        rows = [
+            (
+                entry["source_column"],
+                entry["new_column"],
+                normalize_lookup_values(pd.Series([entry["source_value"]])).iloc[0],
+                json.dumps(entry["output"], default=str),
+                int(bool(entry.get("pinned", False))),
+                now
+            )
+            for entry in entries
+        ]
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                """INSERT OR REPLACE INTO lookup_index
+                (source_column, new_column, source_value, output, pinned, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)""",
+                rows
+            )
+        return len(rows)
+
+    def export_entries(self, source_column: str = None, new_column: str = None):
+        if not self.enabled:
+            return []
+        query = "SELECT source_column, new_column, source_value, output, pinned FROM lookup_index WHERE 1 = 1"
+        params = []
+        if source_column:
+            query += " AND source_column = ?"
+            params.append(source_column)
+        if new_column:
+            query += " AND new_column = ?"
+            params.append(new_column)
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(query + " ORDER BY source_column, new_column, source_value", params).fetchall()
+        return [
+            {
+                "source_column": source,
+                "new_column": new,
+                "source_value": value,
+                "output": json.loads(output),
+                "pinned": bool(pinned)
+            }
+            for source, new, value, output, pinned in rows
+        ]
+
+
+lookup_index = LookupIndex(LOOKUP_PATH, enabled=LOOKUP_ENABLED)
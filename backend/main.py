@@ -5,13 +5,25 @@ new columns based on existing data.
 """
 
 import io
+import hmac
 import json
 import os
+from contextlib import asynccontextmanager
 from typing import List, Dict, Any, Optional
 import pandas as pd
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import FastAPI, UploadFile, File, Form, Body, Header, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, FileResponse, PlainTextResponse
+from backend.services import process_csv, stream_csv, preview_csv, process_bulk
+from backend.cache import row_cache
+from backend.jobs import job_manager
+from backend.lookup import lookup_index
+from backend.providers import close_providers
+from backend.progress import progress_hub
+from backend.formats import OUTPUT_FORMATS, serialize_frame, zip_outputs
+from backend.metrics import stage, request_timings, server_timing_header, render_metrics
+from backend.config import LOOKUP_ADMIN_TOKEN, TIMING_HEADER_ENABLED
 
 
 
@@ -19,16 +31,40 @@ from fastapi.responses import StreamingResponse, JSONResponse
 
 allowed_origins = os.getenv("CORS_ORIGINS", "http://127.0.0.1:5501").split(",")
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await job_manager.start()
+    yield
+    await job_manager.stop()
+    await close_providers()
+
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=allowed_origins,
     allow_credentials=True,
     allow_methods=['*'],
-    allow_headers=['*']
+    allow_headers=['*'],
+    expose_headers=['Server-Timing', 'X-Enrichment-Stats']
 )
 
 
+@app.middleware("http")
+async def timing_header(request: Request, call_next):
+    """Collect the stage durations of this request and report them as Server-Timing."""
+    if not TIMING_HEADER_ENABLED:
+        return await call_next(request)
+    timings = {}
+    token = request_timings.set(timings)
+    try:
+        response = await call_next(request)
+    finally:
+        request_timings.reset(token)
+    if timings:
+        response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
 
 @app.get("/")
 async def root():
@@ -36,44 +72,289 @@ async def root():
     return {"message": "Upload your CSV at /upload_file to get it classified."}
 
 
+@app.get("/metrics")
+async def metrics():
+    """Stage timings, token usage, retry counters and queue depth in Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters of the persistent LLM result cache."""
+    return row_cache.stats()
+
+
+def check_admin_token(token: Optional[str]):
+    """403 response unless LOOKUP_ADMIN_TOKEN is configured and matches; None when the token is valid."""
+    if not LOOKUP_ADMIN_TOKEN:
+        return JSONResponse(
+            status_code=403,
+            content={"status": "error", "message": "Lookup administration is disabled, set LOOKUP_ADMIN_TOKEN"}
+        )
+    if not token or not hmac.compare_digest(token, LOOKUP_ADMIN_TOKEN):
+        return JSONResponse(status_code=403, content={"status": "error", "message": "Invalid admin token"})
+    return None
+
+
+@app.get("/lookups/export")
+async def export_lookups(
+    source_column: str = None,
+    new_column: str = None,
+    x_admin_token: Optional[str] = Header(None)
+):
+    """Export learned (source value -> output) mappings of the lookup index."""
+    denied = check_admin_token(x_admin_token)
+    if denied:
+        return denied
+    return lookup_index.export_entries(source_column, new_column)
+
+
+@app.post("/lookups/import")
+async def import_lookups(
+    entries: List[Dict[str, Any]] = Body(...),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """Seed or pin lookup mappings. Entries need source_column, new_column, source_value and output."""
+    denied = check_admin_token(x_admin_token)
+    if denied:
+        return denied
+    required = {"source_column", "new_column", "source_value", "output"}
+    if not all(required <= set(entry) for entry in entries):
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": f"Every entry needs: {', '.join(sorted(required))}"}
+        )
+    imported = lookup_index.import_entries(entries)
+    return {"status": "success", "imported": imported}
+
+
+@app.post("/jobs")
+async def create_job(
+    file: UploadFile = File(...),
+    columns: str = Form(None),
+    new_columns: str = Form(None),
+    derived_columns: str = Form(None),
+    output_format: str = Form("csv"),
+    allowed_values: str = Form(None),
+    column_schema: str = Form(None),
+    previous_file: UploadFile = File(None),
+    previous_job_id: str = Form(None)
+):
+    """Queue a CSV for background enrichment and return its job id immediately."""
+    if output_format not in OUTPUT_FORMATS:
+        return unsupported_output_format(output_format)
+    previous = await load_previous(previous_file, previous_job_id)
+    if isinstance(previous, JSONResponse):
+        return previous
+    contents = await file.read()
+    job_id = await job_manager.submit(
+        contents, columns, new_columns, derived_columns, output_format, allowed_values, column_schema, previous
+    )
+    return JSONResponse(status_code=202, content={"job_id": job_id, "state": "queued"})
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Report the state and batch progress of a job."""
+    job = await run_in_threadpool(job_manager.store.get, job_id)
+    if not job:
+        return JSONResponse(status_code=404, content={"status": "error", "message": "Job not found"})
+    return {
+        "job_id": job["id"],
+        "state": job["state"],
+        "status": job["status"],
+        "message": job["message"],
+        "batches_done": job["batches_done"],
+        "batches_total": job["batches_total"],
+        "stats": json.loads(job["stats"]) if job["stats"] else None
+    }
+
+
+@app.get("/progress/{progress_id}")
+async def progress_events(progress_id: str):
+    """Server-sent progress events of an upload (its progress_id) or a job (its job_id)."""
+    return StreamingResponse(
+        progress_hub.subscribe(progress_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Download the enriched file of a finished job in the output format it was submitted with."""
+    job = await run_in_threadpool(job_manager.store.get, job_id)
+    if not job:
+        return JSONResponse(status_code=404, content={"status": "error", "message": "Job not found"})
+    if job["state"] != "done":
+        return JSONResponse(
+            status_code=409,
+            content={"status": "error", "message": f"Job is {job['state']}, no result available"}
+        )
+    output_format = job["output_format"] or "csv"
+    media_type, extension = OUTPUT_FORMATS[output_format]
+    return FileResponse(
+        job_manager.store.result_path(job_id, output_format),
+        media_type=media_type,
+        filename=f"updated.{extension}"
+    )
+
+
+async def load_previous(previous_file: Optional[UploadFile], previous_job_id: Optional[str]):
+    """Bytes of the earlier output an incremental run diffs against, None without one, or a JSONResponse."""
+    if previous_file is not None and previous_job_id:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": "Send either previous_file or previous_job_id, not both"}
+        )
+    if previous_file is not None:
+        return await previous_file.read()
+    if not previous_job_id:
+        return None
+    job = await run_in_threadpool(job_manager.store.get, previous_job_id)
+    if not job:
+        return JSONResponse(status_code=404, content={"status": "error", "message": "Previous job not found"})
+    if job["state"] != "done":
+        return JSONResponse(
+            status_code=409,
+            content={"status": "error", "message": f"Previous job is {job['state']}, no result available"}
+        )
+    return await run_in_threadpool(job_manager.store.read_result, previous_job_id, job["output_format"] or "csv")
+
+
+def unsupported_output_format(output_format: str):
+    return JSONResponse(
+        status_code=400,
+        content={
+            "status": "error",
+            "message": f"Unsupported output_format '{output_format}', use one of: {', '.join(OUTPUT_FORMATS)}"
+        }
+    )
+
+
+async def finish_progress(chunks, progress_id: str):
+    """Pass a streamed response body through, then publish its final progress event."""
+    state = "failed"
+    try:
+        async for text in chunks:
+            yield text
+        state = "done"
+    finally:
+        progress_hub.finish(progress_id, state)
+
+
 @app.post("/upload_file")
-async def process_csv(
+async def upload_file(
     file: UploadFile = File(...),
     columns: str = Form(None),
-    new_columns: str = Form(None)
+    new_columns: str = Form(None),
+    derived_columns: str = Form(None),
+    stream: bool = Form(False),
+    output_format: str = Form("csv"),
+    progress_id: str = Form(None),
+    allowed_values: str = Form(None),
+    preview_rows: int = Form(0),
+    column_schema: str = Form(None),
+    previous_file: UploadFile = File(None),
+    previous_job_id: str = Form(None)
 ):
-    """Process CSV file and generate new columns using LLM."""
+    """Process CSV file and generate new columns using LLM.
     
+    With a client-chosen progress_id, per-batch progress is published at /progress/{progress_id}.
+    Run statistics (dedup, lookup, cache and per-model row counts) are returned as
+    "stats" in JSON responses and in the X-Enrichment-Stats header of file responses.
+    With preview_rows > 0 only a sample of that many distinct rows is enriched and
+    returned as JSON, together with estimates for the full run.
+    A column_schema ({new column: {"type": ..., "enum": [...]}}) switches the model
+    to compact positional output validated against the declared types.
+    With previous_file (an earlier enriched output) or previous_job_id, unchanged
+    rows keep their earlier values and only new or changed rows are sent to the model.
+    """
+    
+    progress = (lambda event: progress_hub.publish(progress_id, event)) if progress_id else None
+    progress_state, progress_message = "failed", None
+    streaming = False
     try:    
+        if output_format not in OUTPUT_FORMATS:
+            return unsupported_output_format(output_format)
+        incremental = previous_file is not None or previous_job_id
+        if incremental and (stream or preview_rows > 0):
+            return JSONResponse(
+                status_code=400,
+                content={"status": "error", "message": "Incremental runs cannot be streamed or previewed"}
+            )
+        if preview_rows > 0:
+            preview = await preview_csv(
+                await file.read(), preview_rows, columns, new_columns, derived_columns, allowed_values, column_schema
+            )
+            if isinstance(preview, JSONResponse):
+                return preview
+            progress_state = "done"
+            return {"status": "preview", **preview}
+        if stream:
+            if output_format != "csv":
+                return JSONResponse(
+                    status_code=400,
+                    content={"status": "error", "message": "Streaming responses are always plain CSV"}
+                )
+            # Read the spooled upload in chunks and send rows back as they are enriched
+            chunks = await stream_csv(
+                file.file, columns, new_columns, derived_columns, allowed_values, column_schema, progress
+            )
+            if isinstance(chunks, JSONResponse):
+                progress_message = json.loads(chunks.body).get("message")
+                return chunks
+            # The run continues in the response body, which reports the final progress event itself
+            streaming = bool(progress_id)
+            return StreamingResponse(
+                finish_progress(chunks, progress_id) if progress_id else chunks,
+                media_type="text/csv",
+                headers={"Content-Disposition": "attachment; filename=updated.csv"}
+            )
        
+        previous = await load_previous(previous_file, previous_job_id)
+        if isinstance(previous, JSONResponse):
+            progress_message = json.loads(previous.body).get("message")
+            return previous
         contents = await file.read()
-        result = process_csv(contents, columns, new_columns)
+        result = await process_csv(
+            contents, columns, new_columns, progress, derived_columns, allowed_values, column_schema, previous
+        )
+        if isinstance(result, JSONResponse):
+            progress_message = json.loads(result.body).get("message")
+            return result
+        progress_state = "done"
         
 
         if not result["generated_anything"]:
            return JSONResponse(status_code=200,
                                content={
                                    "status": "no_change",
-                                   "message": "CSV processed successfully, but no new values could be generated."})
+                                   "message": "CSV processed successfully, but no new values could be generated.",
+                                   "stats": result["stats"]})
            
         
         if result["partial_enrichment"]:
             return JSONResponse(status_code=200,
                                 content={"status": "success",
-                                         "message": "CSV processed successfully with partial enrichment."
+                                         "message": "CSV processed successfully with partial enrichment.",
+                                         "stats": result["stats"]
                                          })
         
       
            
         
         
-        output = io.StringIO()
-        result["updated_df"].to_csv(output, index=False)
-        output.seek(0)
+        with stage("serialize"):
+            output = await run_in_threadpool(serialize_frame, result["updated_df"], output_format)
+        media_type, extension = OUTPUT_FORMATS[output_format]
         return StreamingResponse(
-            io.BytesIO(output.getvalue().encode()),
-            media_type="text/csv",
-            headers={"Content-Disposition": "attachment; filename=updated.csv"}
+            io.BytesIO(output),
+            media_type=media_type,
+            headers={
+                "Content-Disposition": f"attachment; filename=updated.{extension}",
+                "X-Enrichment-Stats": json.dumps(result["stats"])
+            }
         )
         
     except Exception as e:
@@ -83,3 +364,70 @@ async def process_csv(
             content={"status": "error", 
                      "message": "We couldn’t process this file due to an internal error. Please try again."}
         )
+    finally:
+        if progress_id and not streaming:
+            progress_hub.finish(progress_id, progress_state, progress_message)
+
+
+@app.post("/upload_files")
+async def upload_files(
+    files: List[UploadFile] = File(...),
+    columns: str = Form(None),
+    new_columns: str = Form(None),
+    derived_columns: str = Form(None),
+    output_format: str = Form("csv"),
+    progress_id: str = Form(None),
+    allowed_values: str = Form(None),
+    column_schema: str = Form(None)
+):
+    """Enrich several files (or zips of files) sharing one spec and return a zip of the results.
+    
+    Rows of all files are batched and deduplicated together; each output keeps
+    the name of its input with the output_format extension.
+    """
+    progress = (lambda event: progress_hub.publish(progress_id, event)) if progress_id else None
+    progress_state, progress_message = "failed", None
+    try:
+        if output_format not in OUTPUT_FORMATS:
+            return unsupported_output_format(output_format)
+        uploads = [(upload.filename, await upload.read()) for upload in files]
+        result = await process_bulk(
+            uploads, columns, new_columns, progress, derived_columns, allowed_values, column_schema
+        )
+        if isinstance(result, JSONResponse):
+            progress_message = json.loads(result.body).get("message")
+            return result
+        progress_state = "done"
+        
+        if not result["generated_anything"]:
+            return JSONResponse(status_code=200,
+                                content={
+                                    "status": "no_change",
+                                    "message": "Files processed successfully, but no new values could be generated.",
+                                    "stats": result["stats"]})
+        
+        with stage("serialize"):
+            serialized = [
+                (filename, await run_in_threadpool(serialize_frame, df, output_format))
+                for filename, df in result["outputs"]
+            ]
+            output = await run_in_threadpool(zip_outputs, serialized, output_format)
+        return StreamingResponse(
+            io.BytesIO(output),
+            media_type="application/zip",
+            headers={
+                "Content-Disposition": "attachment; filename=updated.zip",
+                "X-Enrichment-Stats": json.dumps({
+                    **result["stats"], "partial_enrichment": bool(result["partial_enrichment"])
+                })
+            }
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"status": "error",
+                     "message": "We couldn’t process these files due to an internal error. Please try again."}
+        )
+    finally:
+        if progress_id:
+            progress_hub.finish(progress_id, progress_state, progress_message)
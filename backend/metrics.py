@@ -0,0 +1,138 @@
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_lock = threading.Lock()
+REGISTRY = []
+
+# Stage durations of the current request, read back for the Server-Timing header
+request_timings = ContextVar("request_timings", default=None)
+# Token, retry and failed-row counts of the current enrichment run, read back for progress events
+run_counters = ContextVar("run_counters", default=None)
+
+
+def _format_labels(labels: tuple):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self.values = {}
+        REGISTRY.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(key)} {value}" for key, value in self.values.items()]
+        return lines
+
+
+class Gauge:
+    """A gauge that is either set directly or read from a callback at scrape time."""
+
+    def __init__(self, name: str, documentation: str, function=None):
+        self.name = name
+        self.documentation = documentation
+        self.value = 0
+        self.function = function
+        REGISTRY.append(self)
+
+    def inc(self, amount: float = 1):
+        with _lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+    def set_function(self, function):
+        self.function = function
+
+    def render(self):
+        value = self.function() if self.function else self.value
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets: tuple):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.values = {}
+        REGISTRY.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            counts, total, count = self.values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            counts = [c + (value <= bound) for c, bound in zip(counts, self.buckets)]
+            self.values[key] = (counts, total + value, count + 1)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in self.values.items():
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "enrichment_stage_seconds",
+    "Time spent per pipeline stage (decode, parse, batch_build, prompt_render, llm_wait, json_parse, normalize, concat, serialize).",
+    (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+)
+BATCH_TOKENS = Histogram(
+    "enrichment_batch_tokens",
+    "Tokens per LLM call as reported in the response usage, by type (prompt, completion).",
+    (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+)
+LLM_TOKENS = Counter("enrichment_llm_tokens_total", "Tokens reported by the provider, by type.")
+LLM_REQUESTS = Counter("enrichment_llm_requests_total", "LLM calls started, by model.")
+LLM_RETRIES = Counter("enrichment_llm_retries_total", "LLM calls repeated, by reason (api_error, rate_limited, malformed, missing_rows).")
+ROWS_FAILED = Counter("enrichment_rows_failed_total", "Rows left null after retries and bisection.")
+BATCHES_IN_FLIGHT = Gauge("enrichment_batches_in_flight", "Batches currently waiting on the LLM.")
+JOB_QUEUE_DEPTH = Gauge("enrichment_job_queue_depth", "Jobs waiting for a background worker.")
+
+
+def record_stage(name: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=name)
+    timings = request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def count_run(name: str, amount: float = 1):
+    counters = run_counters.get()
+    if counters is not None:
+        counters[name] = counters.get(name, 0) + amount
+
+
+def server_timing_header(timings: dict):
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,77 @@
+import json
+import math
+import numpy as np
+import pandas as pd
+from backend.prompt import SYSTEM_PROMPT, POSITIONAL_SYSTEM_PROMPT, USER_PROMPT_TEMPLATE
+from backend.batching import get_token_budget, estimate_tokens, estimate_row_tokens
+from backend.cascade import cascade_models
+from backend.config import MAX_BATCH_ROWS, MAX_CONCURRENT_BATCHES
+
+
+def sample_distinct_rows(df: pd.DataFrame, col_to_process: list, sample_rows: int):
+    """Pick up to sample_rows rows with distinct source values, spread over the frequency distribution.
+
+    Distinct combinations are ordered from most to least frequent and picked at
+    even steps, so both the common values and the long tail are represented.
+    Returns (row positions, number of rows in each distinct combination).
+    """
+    group_ids = df.groupby(col_to_process, sort=False, dropna=False).ngroup().to_numpy()
+    counts = np.bincount(group_ids)
+    _, first_positions = np.unique(group_ids, return_index=True)
+    by_frequency = np.argsort(-counts, kind="stable")
+    steps = np.linspace(0, len(by_frequency) - 1, num=min(sample_rows, len(by_frequency))).round().astype(int)
+    return np.sort(first_positions[by_frequency[steps]]), counts
+
+
+def batch_overhead_tokens(user_defined_columns: list, positional: bool = False):
+    """Prompt tokens every batch pays regardless of its rows: the system prompt and the user message frame."""
+    frame = USER_PROMPT_TEMPLATE.format(batch="", user_defined_columns=json.dumps(user_defined_columns))
+    return estimate_tokens(POSITIONAL_SYSTEM_PROMPT if positional else SYSTEM_PROMPT) + estimate_tokens(frame)
+
+
+def estimate_full_run(total_rows: int, group_counts: np.ndarray, prompt_rows: list, enriched: dict,
+                      user_defined_columns: list, elapsed: float, positional: bool = False):
+    """Project tokens, batches and wall time of the full run from an enriched sample.
+
+    Deduplication is exact (from the number of distinct source combinations);
+    the share resolved by lookup, cache or checkpoint and the cost per LLM row
+    are taken from the sample. Tokens are projected as a fixed overhead per batch
+    plus a cost per row: the sample fills few batches, so dividing its billed
+    tokens by its rows alone would spread the system prompt over too few rows.
+    """
+    distinct_rows = len(group_counts)
+    sampled = max(enriched["distinct_rows"], 1)
+    llm_sample_rows = sum(enriched["tier_rows"].values())
+    reuse_ratio = 1 - llm_sample_rows / sampled
+    llm_rows = round(distinct_rows * (1 - reuse_ratio))
+
+    row_tokens = [estimate_row_tokens(row, user_defined_columns, positional) for row in prompt_rows] or [0]
+    overhead = batch_overhead_tokens(user_defined_columns, positional)
+    tokens_per_row = np.mean(row_tokens)
+    if llm_sample_rows and enriched["tokens"]:
+        row_share = enriched["tokens"] - overhead * enriched["batches"]
+        if row_share > 0:
+            tokens_per_row = row_share / llm_sample_rows
+    models = cascade_models()
+    budget = get_token_budget(models[0]).current
+    batches = max(math.ceil(llm_rows * np.mean(row_tokens) / budget), math.ceil(llm_rows / MAX_BATCH_ROWS))
+    if len(models) > 1 and llm_sample_rows:
+        # Escalated rows are batched a second time for the large model
+        batches += math.ceil(batches * enriched["tier_rows"][models[-1]] / llm_sample_rows)
+
+    wall_seconds = None
+    if llm_sample_rows and enriched["batches"]:
+        # Rows per second of one concurrent lane, scaled to the lanes the full run can keep busy
+        lane_rate = llm_sample_rows / (elapsed * min(enriched["batches"], MAX_CONCURRENT_BATCHES))
+        wall_seconds = round(llm_rows / (lane_rate * max(min(batches, MAX_CONCURRENT_BATCHES), 1)), 1)
+
+    return {
+        "total_rows": total_rows,
+        "distinct_rows": distinct_rows,
+        "dedup_ratio": round(1 - distinct_rows / total_rows, 4) if total_rows else 0,
+        "reuse_ratio": round(reuse_ratio, 4),
+        "llm_rows": llm_rows,
+        "tokens": round(batches * overhead + llm_rows * tokens_per_row) if llm_rows else 0,
+        "batches": batches,
+        "wall_seconds": wall_seconds,
+    }
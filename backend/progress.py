@@ -0,0 +1,68 @@
+import json
+import asyncio
+from backend.config import PROGRESS_RETENTION_SECONDS
+
+KEEPALIVE_SECONDS = 15
+
+
+class ProgressChannel:
+    def __init__(self):
+        self.event = None
+        self.version = 0
+        self.subscribers = 0
+        self.changed = asyncio.Event()
+
+
+class ProgressHub:
+    """Latest progress event per upload or job id, fanned out to SSE subscribers.
+
+    Subscribers may connect before the first event is published. Finished
+    channels are kept for PROGRESS_RETENTION_SECONDS so late subscribers still
+    see the final event.
+    """
+
+    def __init__(self, retention_seconds: float):
+        self.retention_seconds = retention_seconds
+        self.channels = {}
+
+    def publish(self, channel_id: str, event: dict):
+        channel = self.channels.setdefault(channel_id, ProgressChannel())
+        channel.event = {**(channel.event or {}), **event}
+        channel.version += 1
+        # Wake every waiting subscriber, then start a fresh event for the next change
+        channel.changed.set()
+        channel.changed = asyncio.Event()
+
+    def finish(self, channel_id: str, state: str, message: str = None):
+        self.publish(channel_id, {"state": state, "message": message, "eta_seconds": 0})
+        asyncio.get_running_loop().call_later(self.retention_seconds, self._discard, channel_id)
+
+    def _discard(self, channel_id: str):
+        channel = self.channels.get(channel_id)
+        if channel and not channel.subscribers:
+            del self.channels[channel_id]
+
+    async def subscribe(self, channel_id: str):
+        """Yield SSE-formatted messages until the channel reports done or failed."""
+        channel = self.channels.setdefault(channel_id, ProgressChannel())
+        channel.subscribers += 1
+        sent_version = 0
+        try:
+            while True:
+                changed = channel.changed
+                if channel.version != sent_version:
+                    sent_version = channel.version
+                    yield f"data: {json.dumps(channel.event)}\n\n"
+                    if channel.event.get("state") in ("done", "failed"):
+                        return
+                try:
+                    await asyncio.wait_for(changed.wait(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            channel.subscribers -= 1
+            if not channel.subscribers and channel.event is None:
+                self.channels.pop(channel_id, None)
+
+
+progress_hub = ProgressHub(PROGRESS_RETENTION_SECONDS)
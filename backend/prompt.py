@@ -186,7 +186,13 @@ Return ONLY the JSON array.
 If you cannot produce the full output while following all rules, return an empty JSON array: [].
 """'''
 
-PROMPT_TEMPLATE = """You are a CSV data enrichment engine that generates new columns for tabular data.
+# Bump whenever SYSTEM_PROMPT or USER_PROMPT_TEMPLATE changes so cached LLM results are not reused.
+PROMPT_VERSION = "2"
+
+# Static instructions sent as the system message. Nothing request-specific goes
+# here so the provider can cache the prefix across batches. The rules are shared
+# by the keyed-object and the positional output formats.
+RULES_PROMPT = """You are a CSV data enrichment engine that generates new columns for tabular data.
 
 ═══════════════════════════════════════
 CORE RULES
@@ -225,27 +231,27 @@ EXAMPLES
 ═══════════════════════════════════════
 
 DERIVED (from row values):
-Input: {{"quantity": 3, "price": 50}}
+Input: {"quantity": 3, "price": 50}
 Column: "total"
-Output: {{"__row_id__": "1", "total": 150}}
+Output: {"__row_id__": "1", "total": 150}
 
 INFERRED (semantic reasoning):
-Input: {{"review": "Great product, highly recommend!"}}
+Input: {"review": "Great product, highly recommend!"}
 Column: "sentiment"
-Output: {{"__row_id__": "1", "sentiment": "POSITIVE"}}
+Output: {"__row_id__": "1", "sentiment": "POSITIVE"}
 
-Input: {{"review": "Broke after one day"}}
+Input: {"review": "Broke after one day"}
 Column: "sentiment"
-Output: {{"__row_id__": "2", "sentiment": "NEGATIVE"}}
+Output: {"__row_id__": "2", "sentiment": "NEGATIVE"}
 
 ENRICHED (world knowledge):
-Input: {{"city": "Paris"}}
+Input: {"city": "Paris"}
 Column: "country"
-Output: {{"__row_id__": "1", "country": "France"}}
+Output: {"__row_id__": "1", "country": "France"}
 
-Input: {{"city": "UnknownCity123"}}
+Input: {"city": "UnknownCity123"}
 Column: "country"
-Output: {{"__row_id__": "2", "country": null}}
+Output: {"__row_id__": "2", "country": null}
 
 ═══════════════════════════════════════
 INFERRED COLUMN REASONING GUIDELINES
@@ -295,7 +301,9 @@ Output normalization rules (MANDATORY):
 
 
 
-═══════════════════════════════════════
+"""
+
+OBJECT_OUTPUT_FORMAT = """═══════════════════════════════════════
 OUTPUT FORMAT (STRICT)
 ═══════════════════════════════════════
 
@@ -303,11 +311,11 @@ Return ONLY a valid JSON array. No markdown, no explanations, no code fences.
 
 Structure:
 [
-  {{
+  {
     "__row_id__": "<original_id>",
     "<new_column_1>": <value>,
     "<new_column_2>": <value>
-  }},
+  },
   ...
 ]
 
@@ -322,16 +330,88 @@ Requirements:
 
 CRITICAL: Column names in your output MUST match the requested column names character-for-character.
 If a requested column is named "lead_priority(high/medium/low)", your output must use that exact key.
+"""
+
+OBJECT_INPUT_FORMAT = """═══════════════════════════════════════
+INPUT FORMAT
 ═══════════════════════════════════════
-INPUT DATA
+
+The user message contains one compact JSON object:
+{"columns": ["__row_id__", "<source_column_1>", ...], "rows": [[<id>, <value_1>, ...], ...]}
+
+- "columns" lists the column names once, in order
+- Each entry of "rows" is one input row with values in the same order as "columns"
+- The first value of each row is its __row_id__; copy it unchanged into the output object
+- The requested new columns follow after "REQUESTED NEW COLUMNS:"
+
+Generate the JSON array now."""
+
+# Output and input sections for positional output (column_schema requests): each
+# row comes back as an array of values in column order instead of a keyed object
+POSITIONAL_OUTPUT_FORMAT = """═══════════════════════════════════════
+OUTPUT FORMAT (STRICT)
 ═══════════════════════════════════════
 
-INPUT ROWS:
+Return ONLY a valid JSON object with a single key "rows". No markdown, no explanations, no code fences.
+This replaces the object format shown in the examples above: column names are NOT repeated per row.
+
+Structure:
+{"rows": [[<row_id>, <value_for_column_1>, <value_for_column_2>, ...], ...]}
+
+Requirements:
+✓ One array per input row, in input order
+✓ The first value of each array is the row's id, copied unchanged
+✓ Then exactly one value per requested new column, in the order the columns are listed
+✓ Every value must match its column's "type"; when a column lists "enum", use one of those values exactly
+✓ Use null for missing values (not "", "N/A", or "unknown")
+✓ Do NOT include existing input columns
+"""
+
+POSITIONAL_INPUT_FORMAT = """═══════════════════════════════════════
+INPUT FORMAT
+═══════════════════════════════════════
+
+The user message contains one compact JSON object:
+{"columns": ["__row_id__", "<source_column_1>", ...], "rows": [[<id>, <value_1>, ...], ...]}
+
+- "columns" lists the column names once, in order
+- Each entry of "rows" is one input row with values in the same order as "columns"
+- The first value of each row is its id; copy it unchanged as the first value of its output array
+- The requested new columns follow after "REQUESTED NEW COLUMNS:" as a list of
+  {"name": ..., "type": ..., "enum": [...]} entries, in output order
+
+Generate the JSON object now."""
+
+SYSTEM_PROMPT = RULES_PROMPT + OBJECT_OUTPUT_FORMAT + OBJECT_INPUT_FORMAT
+
+POSITIONAL_SYSTEM_PROMPT = RULES_PROMPT + POSITIONAL_OUTPUT_FORMAT + POSITIONAL_INPUT_FORMAT
+
+
+USER_PROMPT_TEMPLATE = """INPUT ROWS:
 {batch}
 
 REQUESTED NEW COLUMNS:
-{user_defined_columns}
+{user_defined_columns}"""
 
-═══════════════════════════════════════
 
-Generate the JSON array now:"""
+# Asks for one local expression instead of row-by-row values for a DERIVED column.
+DERIVED_EXPRESSION_PROMPT = """Write ONE expression that computes the new column "{column}" from the other values in the same row.
+
+The expression language is a subset of Python expressions:
+- Column names as bare identifiers, or col("column name") for names with spaces or symbols
+- Numbers, strings, True, False, None
+- Arithmetic: + - * / // % **
+- Comparisons: == != < <= > >=, combined with and / or / not
+- Functions: {functions}
+  - if_else(condition, value_if_true, value_if_false)
+  - map(column, {{"input": "output", ...}}, default)
+  - days_between(start_date, end_date), substr(text, start, length)
+
+COLUMNS:
+{columns}
+
+SAMPLE ROWS (values in column order):
+{rows}
+
+Return ONLY the expression, with no explanation, markdown or code fences.
+If the column cannot be computed from the row values alone, return NONE."""
@@ -0,0 +1,160 @@
+import json
+import httpx
+from typing import NamedTuple, Optional
+from groq import AsyncGroq, RateLimitError
+from backend.config import (
+    LLM_PROVIDER, LLM_API_KEYS, LLM_BASE_URL, HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_KEEPALIVE_EXPIRY_SECONDS, HTTP_CONNECT_TIMEOUT_SECONDS, HTTP_READ_TIMEOUT_SECONDS
+)
+
+
+class ProviderRateLimitError(Exception):
+    """The provider answered 429; retry_after is its retry-after hint in seconds, if it sent one."""
+
+    def __init__(self, retry_after: Optional[float] = None):
+        super().__init__("Rate limit reached")
+        self.retry_after = retry_after
+
+
+class ChatChunk(NamedTuple):
+    content: Optional[str]
+    finish_reason: Optional[str]
+    usage: Optional[dict]
+
+
+def _retry_after(headers):
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def error_status(error: Exception) -> Optional[int]:
+    """HTTP status of a failed provider call (Groq SDK or httpx error), or None for network errors."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+JSON_MODE = {"type": "json_object"}
+
+
+class GroqProvider:
+    """Groq's SDK on the shared connection pool; retries are left to services and the scheduler."""
+
+    def __init__(self, api_key: str, base_url: str, http_client: httpx.AsyncClient):
+        self.client = AsyncGroq(
+            api_key=api_key, base_url=base_url, max_retries=0, timeout=http_client.timeout, http_client=http_client
+        )
+
+    async def stream(self, model: str, messages: list, json_mode: bool = False):
+        extra = {"response_format": JSON_MODE} if json_mode else {}
+        try:
+            stream = await self.client.chat.completions.create(model=model, messages=messages, stream=True, **extra)
+            async for chunk in stream:
+                # Groq reports usage on the last chunk under x_groq
+                usage = getattr(getattr(chunk, "x_groq", None), "usage", None) or getattr(chunk, "usage", None)
+                choice = chunk.choices[0] if chunk.choices else None
+                yield ChatChunk(
+                    choice.delta.content if choice else None,
+                    choice.finish_reason if choice else None,
+                    usage.model_dump() if usage else None
+                )
+        except RateLimitError as e:
+            raise ProviderRateLimitError(_retry_after(e.response.headers)) from e
+
+    async def complete(self, model: str, messages: list):
+        try:
+            response = await self.client.chat.completions.create(model=model, messages=messages)
+        except RateLimitError as e:
+            raise ProviderRateLimitError(_retry_after(e.response.headers)) from e
+        return response.choices[0].message.content or ""
+
+
+class OpenAICompatibleProvider:
+    """Any server exposing POST {base_url}/chat/completions with OpenAI-style streaming, e.g. vLLM or Ollama."""
+
+    def __init__(self, api_key: Optional[str], base_url: str, http_client: httpx.AsyncClient):
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.http_client = http_client
+
+    def _check(self, response: httpx.Response):
+        if response.status_code == 429:
+            raise ProviderRateLimitError(_retry_after(response.headers))
+        response.raise_for_status()
+
+    async def stream(self, model: str, messages: list, json_mode: bool = False):
+        body = {"model": model, "messages": messages, "stream": True, "stream_options": {"include_usage": True}}
+        if json_mode:
+            body["response_format"] = JSON_MODE
+        async with self.http_client.stream("POST", self.url, json=body, headers=self.headers) as response:
+            if response.status_code >= 400:
+                await response.aread()
+            self._check(response)
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    return
+                chunk = json.loads(data)
+                choice = (chunk.get("choices") or [None])[0]
+                yield ChatChunk(
+                    (choice.get("delta") or {}).get("content") if choice else None,
+                    choice.get("finish_reason") if choice else None,
+                    chunk.get("usage") or (chunk.get("x_groq") or {}).get("usage")
+                )
+
+    async def complete(self, model: str, messages: list):
+        response = await self.http_client.post(
+            self.url, json={"model": model, "messages": messages}, headers=self.headers
+        )
+        self._check(response)
+        return response.json()["choices"][0]["message"]["content"] or ""
+
+
+PROVIDERS = {"groq": GroqProvider, "openai": OpenAICompatibleProvider}
+
+_http_client = None
+_providers = None
+
+
+def get_http_client():
+    """The keep-alive connection pool shared by every provider client, created on first use."""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS
+            ),
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS)
+        )
+    return _http_client
+
+
+def get_providers():
+    """One provider client per API key, created on first use."""
+    global _providers
+    if _providers is None:
+        if LLM_PROVIDER not in PROVIDERS:
+            raise ValueError(f"Unknown LLM_PROVIDER '{LLM_PROVIDER}', use one of: {', '.join(PROVIDERS)}")
+        if LLM_PROVIDER == "groq" and not LLM_API_KEYS:
+            raise ValueError("GROQ_API_KEY environment variable is not set")
+        if LLM_PROVIDER == "openai" and not LLM_BASE_URL:
+            raise ValueError("LLM_BASE_URL must be set for the openai provider")
+        provider = PROVIDERS[LLM_PROVIDER]
+        # Local OpenAI-compatible servers may not need a key at all
+        _providers = [provider(key, LLM_BASE_URL, get_http_client()) for key in LLM_API_KEYS or [None]]
+    return _providers
+
+
+async def close_providers():
+    global _http_client, _providers
+    if _http_client is not None:
+        await _http_client.aclose()
+    _http_client = None
+    _providers = None
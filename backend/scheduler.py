@@ -0,0 +1,113 @@
+import time
+import asyncio
+from backend.providers import get_providers
+from backend.config import (
+    LLM_MODEL, FALLBACK_MODEL, RATE_LIMIT_RPM, RATE_LIMIT_TPM, RATE_LIMIT_DEFAULT_RETRY_AFTER
+)
+
+
+class TokenBucket:
+    """Refills continuously up to a per-minute limit; a limit of 0 means unlimited."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.rate = per_minute / 60
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: int):
+        """Seconds until amount can be taken (requests larger than the bucket only wait for a full one)."""
+        if not self.capacity:
+            return 0
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: int):
+        if self.capacity:
+            self.tokens -= min(amount, self.capacity)
+
+
+class Lane:
+    """One API key serving one model, with its own request and token budgets."""
+
+    def __init__(self, provider, model: str):
+        self.provider = provider
+        self.model = model
+        self.requests = TokenBucket(RATE_LIMIT_RPM)
+        self.tokens = TokenBucket(RATE_LIMIT_TPM)
+        self.blocked_until = 0
+
+    def wait_time(self, tokens: int):
+        return max(
+            self.blocked_until - time.monotonic(),
+            self.requests.wait_time(1),
+            self.tokens.wait_time(tokens)
+        )
+
+    def consume(self, tokens: int):
+        self.requests.consume(1)
+        self.tokens.consume(tokens)
+
+    def block(self, seconds: float):
+        """Stop using this lane until the provider's retry-after has passed."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+def retry_after_seconds(error):
+    """The provider's retry-after for a 429, falling back to a fixed delay."""
+    retry_after = getattr(error, "retry_after", None)
+    return RATE_LIMIT_DEFAULT_RETRY_AFTER if retry_after is None else retry_after
+
+
+class RequestScheduler:
+    """Paces LLM calls across API keys and fails over to FALLBACK_MODEL when the primary is saturated.
+
+    Provider clients are created on the first acquire, not at import.
+    """
+
+    def __init__(self, get_providers, model: str, fallback_model: str = None):
+        self.get_providers = get_providers
+        self.models = [model] + ([fallback_model] if fallback_model and fallback_model != model else [])
+        self.providers = None
+        self.tiers = None
+        self._next = 0
+
+    async def acquire(self, tokens: int):
+        """Wait for a lane with capacity for one request of the given size and reserve it."""
+        providers = self.get_providers()
+        if providers is not self.providers:
+            # First call, or the clients were recreated after close_providers
+            self.providers = providers
+            self.tiers = [[Lane(provider, model) for provider in providers] for model in self.models]
+        while True:
+            shortest_wait = None
+            for lanes in self.tiers:
+                # Rotate the starting key so load spreads evenly across keys
+                start = self._next % len(lanes)
+                for lane in lanes[start:] + lanes[:start]:
+                    wait = lane.wait_time(tokens)
+                    if wait <= 0:
+                        lane.consume(tokens)
+                        self._next += 1
+                        return lane
+                    shortest_wait = wait if shortest_wait is None else min(shortest_wait, wait)
+            await asyncio.sleep(shortest_wait)
+
+
+scheduler = RequestScheduler(get_providers, LLM_MODEL, FALLBACK_MODEL)
+_model_schedulers = {LLM_MODEL: scheduler}
+
+
+def get_scheduler(model: str):
+    """The scheduler for a model; models other than LLM_MODEL get their own lanes and no fallback."""
+    if model not in _model_schedulers:
+        _model_schedulers[model] = RequestScheduler(get_providers, model)
+    return _model_schedulers[model]
@@ -0,0 +1,93 @@
+import json
+import pandas as pd
+from fastapi.responses import JSONResponse
+
+SCHEMA_TYPES = ("string", "number", "integer", "boolean")
+
+
+def _schema_error(message: str):
+    return JSONResponse(status_code=400, content={"status": "error", "message": message})
+
+
+def parse_column_schema(column_schema: str, user_defined_columns: list, derived: list = ()):
+    """Parse the column_schema form field: a JSON object of {new column: {"type": ..., "enum": [...]}}.
+
+    type is one of string, number, integer or boolean (default string); enum is optional.
+    New columns left out are strings and entries for derived columns are ignored.
+    Returns {column: {"type": ..., "enum": list or None}} for every LLM column, {} when
+    no schema was sent, or a JSONResponse describing the problem.
+    """
+    if not column_schema:
+        return {}
+    try:
+        specs = json.loads(column_schema)
+    except json.JSONDecodeError:
+        specs = None
+    if not isinstance(specs, dict) or not all(isinstance(spec, dict) for spec in specs.values()):
+        return _schema_error('column_schema must be a JSON object mapping new column names to {"type": ..., "enum": [...]}')
+    specs = {column.strip(): spec for column, spec in specs.items()}
+
+    unknown = [col for col in specs if col not in user_defined_columns and col not in derived]
+    if unknown:
+        return _schema_error(f"column_schema names columns that are not in new_columns: {', '.join(unknown)}")
+
+    schema = {}
+    for col in user_defined_columns:
+        spec = specs.get(col, {})
+        column_type = spec.get("type", "string")
+        enum = spec.get("enum")
+        if column_type not in SCHEMA_TYPES:
+            return _schema_error(f"Unsupported type '{column_type}' for {col}, use one of: {', '.join(SCHEMA_TYPES)}")
+        if enum is not None and (not isinstance(enum, list) or not enum):
+            return _schema_error(f"enum for {col} must be a non-empty list")
+        schema[col] = {"type": column_type, "enum": enum}
+    return schema
+
+
+def schema_vocabularies(schema: dict):
+    """Enums as allowed_values vocabularies, so the cascade escalates off-enum answers."""
+    return {
+        col: {str(value).strip().casefold() for value in spec["enum"]}
+        for col, spec in schema.items() if spec["enum"]
+    }
+
+
+def describe_columns(schema: dict, user_defined_columns: list):
+    """The requested columns as the prompt lists them in positional mode: name, type and enum, in output order."""
+    return [
+        {"name": col, "type": schema[col]["type"], **({"enum": schema[col]["enum"]} if schema[col]["enum"] else {})}
+        for col in user_defined_columns
+    ]
+
+
+def _conform(values: pd.Series, spec: dict):
+    """Coerce one column of answers to its declared type; values that do not fit become NA."""
+    text = values.astype("string").str.strip()
+    if spec["enum"]:
+        # Answers are matched case-insensitively and replaced by the canonical enum value
+        canonical = {str(value).strip().casefold(): value for value in spec["enum"]}
+        return text.str.casefold().map(canonical)
+    if spec["type"] == "string":
+        return text.mask(text == "")
+    if spec["type"] == "boolean":
+        return text.str.casefold().map({"true": True, "false": False})
+    numbers = pd.to_numeric(text, errors="coerce")
+    if spec["type"] == "integer":
+        return numbers.where(numbers % 1 == 0).astype("Int64")
+    return numbers
+
+
+def conform_frame(frame: pd.DataFrame, schema: dict):
+    """Check every column of frame against its schema; values of the wrong type or outside the enum become None."""
+    checked = pd.DataFrame({col: _conform(frame[col], schema[col]) for col in frame.columns}, index=frame.index)
+    checked = checked.astype(object)
+    return checked.where(checked.notna(), None)
+
+
+def validate_positional_rows(rows: list, user_defined_columns: list, schema: dict):
+    """Turn positional answers (one list of values per row, in column order) into row dicts.
+
+    Every column is checked against its schema in one vectorized pass.
+    """
+    frame = pd.DataFrame(rows, columns=user_defined_columns, dtype=object)
+    return conform_frame(frame, schema).to_dict(orient="records")
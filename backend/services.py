@@ -1,172 +1,931 @@
 import os
 import io
 import json
+import time
+import asyncio
+import zipfile
+import numpy as np
 import pandas as pd
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
-from backend.prompt import PROMPT_TEMPLATE
-from backend.config import client,MAX_FILE_SIZE_BYTES,BATCH_SIZE,LLM_MODEL,MAX_FILE_SIZE_MB
+from backend.prompt import SYSTEM_PROMPT, POSITIONAL_SYSTEM_PROMPT, USER_PROMPT_TEMPLATE
+from backend.cache import row_cache, row_cache_key
+from backend.checkpoint import checkpoint_store, checkpoint_run_key
+from backend.batching import BatchPlanner, get_token_budget, estimate_tokens, estimate_row_tokens
+from backend.scheduler import get_scheduler, retry_after_seconds
+from backend.cascade import cascade_models, parse_allowed_values, needs_escalation
+from backend.schema import (parse_column_schema, schema_vocabularies, describe_columns, validate_positional_rows,
+                            conform_frame)
+from backend.providers import ProviderRateLimitError, error_status
+from backend.json_stream import JsonArrayStreamParser
+from backend.lookup import lookup_index, normalize_lookup_values
+from backend.derived import parse_derived_columns, resolve_derived_expressions, apply_derived_columns
+from backend.formats import detect_input_format, decompress, read_frame, expand_archives, PayloadTooLargeError
+from backend.preview import sample_distinct_rows, estimate_full_run
+from backend.incremental import match_previous
+from backend.metrics import (stage, record_stage, count_run, run_counters, BATCH_TOKENS, LLM_TOKENS, LLM_REQUESTS,
+                             LLM_RETRIES, ROWS_FAILED, BATCHES_IN_FLIGHT)
+from backend.config import MAX_FILE_SIZE_BYTES,LLM_MODEL,MAX_FILE_SIZE_MB,PREVIOUS_MAX_FILE_SIZE_MB,MAX_CONCURRENT_BATCHES,STREAM_CHUNK_ROWS,PREVIEW_MAX_ROWS,BULK_MAX_FILES,BULK_MAX_TOTAL_BYTES,LLM_MAX_RETRIES,LLM_RETRY_BACKOFF_SECONDS,RATE_LIMIT_MAX_RETRIES,LLM_JSON_MODE
 
 
 
 
 
-def chunk_list(lst, chunk_size):
-    """Split a list into chunks of specified size."""
-    for i in range(0, len(lst), chunk_size):
-        yield lst[i:i + chunk_size]
-        
-        
-def process_csv(contents: bytes, columns: str = None, new_columns: str = None):
+def serialize_batch(batch):
+    """Compact wire format: column names once, then one value array per row.
+    
+    Rows are identified by their position in the batch instead of their
+    __row_id__, which keeps ids short; parse_batch_response maps them back.
+    """
+    source_columns = [col for col in batch[0] if col != "__row_id__"]
+    return json.dumps(
+        {
+            "columns": ["__row_id__"] + source_columns,
+            "rows": [[i] + [row[col] for col in source_columns] for i, row in enumerate(batch)]
+        },
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str
+    )
+
+
+def build_messages(batch, user_defined_columns, schema: dict = None):
+    """Static instructions as the system message, rows and requested columns as the user message.
+    
+    With a column schema the positional instructions are used and each requested
+    column is listed with its type and enum.
+    """
+    requested = describe_columns(schema, user_defined_columns) if schema else user_defined_columns
+    return [
+        {"role": "system", "content": POSITIONAL_SYSTEM_PROMPT if schema else SYSTEM_PROMPT},
+        {"role": "user", "content": USER_PROMPT_TEMPLATE.format(
+            batch=serialize_batch(batch),
+            user_defined_columns=json.dumps(requested, ensure_ascii=False)
+        )}
+    ]
+
+
+def record_usage(usage):
+    """Count the prompt and completion tokens the provider billed for one call."""
+    for kind in ("prompt", "completion"):
+        tokens = usage.get(f"{kind}_tokens") or 0
+        LLM_TOKENS.inc(tokens, type=kind)
+        BATCH_TOKENS.observe(tokens, type=kind)
+        count_run("tokens", tokens)
+
+
+async def gather_or_cancel(*coroutines):
+    """asyncio.gather that cancels the remaining tasks as soon as one fails.
+    
+    Plain gather leaves the siblings running, so a failed run would keep
+    spending tokens on batches nobody reads and race a retry for the same rows.
+    """
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
     try:
-        
-       
-        if len(contents) > MAX_FILE_SIZE_BYTES:
-            return JSONResponse(
-                status_code=400,
-                content={
-                    "status": "error",
-                    "message": f"File size exceeds maximum allowed size of {MAX_FILE_SIZE_MB}MB"
-                }
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def request_batch(batch, user_defined_columns, budget, model: str = LLM_MODEL, schema: dict = None):
+    """Call the LLM once for a batch, streaming its output.
+    
+    Row objects are parsed as soon as their closing brace arrives, so a
+    truncated or interrupted response still keeps every complete row.
+    Returns {batch position: model row} for the rows the model answered, or None
+    when the response contains no usable rows. API errors before any row has
+    arrived are retried with backoff; once LLM_MAX_RETRIES is exhausted, or at once
+    for a 4xx the same batch would get again (context length, content filter,
+    invalid JSON mode output), the batch counts as malformed so the caller splits it.
+    Authentication and unknown-model errors are re-raised.
+    Calls are paced by the scheduler; a 429 blocks the key it came from for the
+    provider's retry-after and the request is rescheduled on another key or model.
+    Time spent parsing the stream is reported as json_parse and excluded from llm_wait.
+    With a column schema the model answers positionally, [position, value, ...] per row,
+    and the values are validated against the schema before they are returned.
+    """
+    positional = bool(schema)
+    estimated_tokens = estimate_tokens(POSITIONAL_SYSTEM_PROMPT if positional else SYSTEM_PROMPT) + sum(
+        estimate_row_tokens(row, user_defined_columns, positional) for row in batch
+    )
+    with stage("prompt_render"):
+        messages = build_messages(batch, user_defined_columns, schema)
+    attempt = 0
+    rate_limited = 0
+    while True:
+        parser = JsonArrayStreamParser(list if positional else dict)
+        result = []
+        truncated = False
+        lane = await get_scheduler(model).acquire(estimated_tokens)
+        LLM_REQUESTS.inc(model=lane.model)
+        started = time.perf_counter()
+        parse_seconds = 0.0
+        try:
+            async for chunk in lane.provider.stream(lane.model, messages, json_mode=positional and LLM_JSON_MODE):
+                if chunk.usage:
+                    record_usage(chunk.usage)
+                if chunk.content:
+                    parse_started = time.perf_counter()
+                    result.extend(parser.feed(chunk.content))
+                    parse_seconds += time.perf_counter() - parse_started
+                if chunk.finish_reason == "length":
+                    truncated = True
+            break
+        except ProviderRateLimitError as e:
+            lane.block(retry_after_seconds(e))
+            if result:
+                truncated = True
+                break
+            rate_limited += 1
+            LLM_RETRIES.inc(reason="rate_limited")
+            count_run("retries")
+            if rate_limited > RATE_LIMIT_MAX_RETRIES:
+                raise
+        except Exception as e:
+            if result:
+                # Keep the rows that already arrived; the rest are requested again
+                truncated = True
+                break
+            status = error_status(e)
+            if status in (401, 403, 404):
+                # A bad key or unknown model fails every batch alike
+                raise
+            if attempt == LLM_MAX_RETRIES or (status is not None and 400 <= status < 500 and status not in (408, 409)):
+                # Only rate limits abort the run; a batch the provider keeps refusing is split instead
+                budget.shrink()
+                return None
+            LLM_RETRIES.inc(reason="api_error")
+            count_run("retries")
+            await asyncio.sleep(LLM_RETRY_BACKOFF_SECONDS * 2 ** attempt)
+            attempt += 1
+        finally:
+            record_stage("json_parse", parse_seconds)
+            record_stage("llm_wait", time.perf_counter() - started - parse_seconds)
+    
+    if positional:
+        # Arrays of the wrong length cannot be mapped to columns and count as missing rows
+        model_rows = {str(r[0]): r[1:] for r in result if len(r) == len(user_defined_columns) + 1}
+    else:
+        model_rows = {str(r["__row_id__"]): r for r in result if "__row_id__" in r}
+    answered = {position: model_rows[str(position)] for position in range(len(batch)) if str(position) in model_rows}
+    if positional and answered:
+        with stage("normalize"):
+            values = validate_positional_rows(list(answered.values()), user_defined_columns, schema)
+        answered = dict(zip(answered, values))
+    if not answered:
+        budget.shrink()
+        return None
+    
+    if truncated or parser.errors:
+        budget.shrink()
+    else:
+        budget.grow()
+    return answered
+
+
+async def enrich_batch(batch, user_defined_columns, budget, model: str = LLM_MODEL, split_failures: bool = True,
+                       schema: dict = None):
+    """Send one batch to the LLM and return its rows normalized to the batch order.
+    
+    Malformed responses are retried with backoff, then the batch is split in
+    halves down to single rows so bad output only costs the rows that cause it.
+    Rows missing from an otherwise valid response are requested again on their
+    own. A single row that never gets a valid answer comes back as nulls.
+    Without split_failures a batch that keeps failing comes back as nulls at
+    once, for cascade tiers whose null rows are escalated anyway.
+    """
+    answered = None
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        answered = await request_batch(batch, user_defined_columns, budget, model, schema)
+        if answered is not None:
+            break
+        if attempt < LLM_MAX_RETRIES:
+            LLM_RETRIES.inc(reason="malformed")
+            count_run("retries")
+            await asyncio.sleep(LLM_RETRY_BACKOFF_SECONDS * 2 ** attempt)
+    
+    if answered is None:
+        if not split_failures:
+            return [{"__row_id__": row["__row_id__"], **{col: None for col in user_defined_columns}} for row in batch]
+        if len(batch) == 1:
+            ROWS_FAILED.inc()
+            count_run("failed_rows")
+            return [{"__row_id__": batch[0]["__row_id__"], **{col: None for col in user_defined_columns}}]
+        mid = len(batch) // 2
+        halves = await gather_or_cancel(
+            enrich_batch(batch[:mid], user_defined_columns, budget, model, schema=schema),
+            enrich_batch(batch[mid:], user_defined_columns, budget, model, schema=schema)
+        )
+        return halves[0] + halves[1]
+    
+    missing = [row for position, row in enumerate(batch) if position not in answered]
+    recovered = {}
+    if missing:
+        LLM_RETRIES.inc(reason="missing_rows")
+        recovered_rows = await enrich_batch(missing, user_defined_columns, budget, model, split_failures, schema)
+        recovered = {r["__row_id__"]: r for r in recovered_rows}
+    
+    # Map batch positions back to the real __row_id__
+    with stage("normalize"):
+        normalized_rows = []
+        for position, row in enumerate(batch):
+            rid = row["__row_id__"]
+            if position in answered:
+                normalized_rows.append({**answered[position], "__row_id__": rid})
+            else:
+                normalized_rows.append(recovered[rid])
+    return normalized_rows
+
+
+def resolve_columns(df: pd.DataFrame, columns: str = None, new_columns: str = None):
+    """Validate the requested source columns against the CSV header.
+    
+    Returns (col_to_process, user_defined_columns) or a JSONResponse describing the problem.
+    """
+    if columns:
+        col_to_process = [column.strip() for column in columns.split(",")]
+    else:
+        col_to_process = df.select_dtypes(include=["object", "string"]).columns.tolist()
+    
+    missing_cols = [col for col in col_to_process if col not in df.columns.tolist()]
+    if missing_cols:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "status": "error",
+                "message": f"The following source columns do not exist in the CSV: {', '.join(missing_cols)}"
+            }
+        )
+    
+    duplicates = df.columns[df.columns.duplicated()].tolist()
+    if duplicates:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "status": "error",
+                "message": f"CSV contains duplicate columns: {', '.join(duplicates)}"
+            }
+        )
+    
+    if not col_to_process:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": "No columns to process"}
+        )
+    
+    if new_columns:
+        user_defined_columns = [col.strip() for col in new_columns.split(",")]
+    else:
+        user_defined_columns = []
+    
+    return col_to_process, user_defined_columns
+
+
+async def resolve_request(df: pd.DataFrame, columns: str = None, new_columns: str = None, derived_columns: str = None):
+    """Resolve source, LLM-generated and locally derived columns for a request.
+    
+    Derived columns are taken out of the LLM columns; those the model could not
+    express as a local expression are generated by the LLM instead.
+    Returns (col_to_process, user_defined_columns, expressions) or a JSONResponse.
+    """
+    resolved = resolve_columns(df, columns, new_columns)
+    if isinstance(resolved, JSONResponse):
+        return resolved
+    col_to_process, user_defined_columns = resolved
+    
+    specs = parse_derived_columns(derived_columns)
+    if isinstance(specs, JSONResponse):
+        return specs
+    resolved_derived = await resolve_derived_expressions(df, specs)
+    if isinstance(resolved_derived, JSONResponse):
+        return resolved_derived
+    expressions, unresolved = resolved_derived
+    
+    user_defined_columns = [col for col in user_defined_columns if col not in expressions]
+    user_defined_columns += [col for col in unresolved if col not in user_defined_columns]
+    return col_to_process, user_defined_columns, expressions
+
+
+def parse_answer_rules(allowed_values: str, column_schema: str, user_defined_columns: list, expressions: dict):
+    """Parse the allowed_values and column_schema fields; returns (vocabularies, schema) or a JSONResponse.
+    
+    Enums from the schema also serve as allowed values for the columns allowed_values leaves out.
+    """
+    vocabularies = parse_allowed_values(allowed_values)
+    if isinstance(vocabularies, JSONResponse):
+        return vocabularies
+    schema = parse_column_schema(column_schema, user_defined_columns, list(expressions))
+    if isinstance(schema, JSONResponse):
+        return schema
+    return {**schema_vocabularies(schema), **vocabularies}, schema
+
+
+def non_empty_columns(outputs: dict, derived_df: pd.DataFrame):
+    """Whether each new column received at least one non-blank value.
+    
+    LLM columns are checked on their per-group arrays, which hold the same
+    values as the full columns; everything is checked in one vectorized pass.
+    """
+    frame = pd.concat([pd.DataFrame(outputs), derived_df.reset_index(drop=True)], axis=1)
+    return (frame.astype("string")
+            .apply(lambda values: values.str.strip().str.len().gt(0))
+            .fillna(False)
+            .any())
+
+
+async def enrich_frame(df: pd.DataFrame, col_to_process: list, user_defined_columns: list,
+                       progress=None, checkpoint_key: str = None, expressions: dict = None,
+                       vocabularies: dict = None, schema: dict = None):
+    """Generate the new columns for every row of df.
+    
+    progress, if given, is called with a progress event dict (batches done and total,
+    distinct rows done and total, tokens, retries, failed rows, ETA) as batches complete.
+    checkpoint_key, if given, persists every completed batch and skips rows already
+    completed by an earlier attempt of the same run.
+    expressions maps derived columns to expressions evaluated locally instead of by the LLM.
+    vocabularies maps new columns to their allowed (casefolded) values; with
+    CASCADE_MODEL set, small-model answers outside them go on to LLM_MODEL.
+    schema, if given, maps new columns to their type and enum and switches the
+    model to positional output (see parse_column_schema).
+    New columns are added to df in place. Returns a dict with the enriched frame
+    and run statistics.
+    """
+    derived_df = await run_in_threadpool(apply_derived_columns, df, expressions or {})
+    
+    # Enrich each distinct combination of source values once; the model sees
+    # the group id as __row_id__ and answers are written into per-group output
+    # arrays, which are scattered back to the rows by group id below
+    with stage("batch_build"):
+        group_ids = df.groupby(col_to_process, sort=False, dropna=False).ngroup().to_numpy()
+        _, first_positions = np.unique(group_ids, return_index=True)
+        distinct_source = df[col_to_process].iloc[first_positions].astype(object)
+        # Only the distinct rows are blanked and converted to dicts for the prompt
+        row_data = (distinct_source.where(distinct_source.notna(), "")
+                    .assign(__row_id__=np.arange(len(first_positions)))
+                    .to_dict(orient="records"))
+    if not user_defined_columns:
+        row_data = []
+    distinct_rows = len(row_data)
+    outputs = {col: np.full(len(first_positions), None, dtype=object) for col in user_defined_columns}
+    
+    # With a single source column, new values are functions of that one value:
+    # resolve already known values from the lookup index with a vectorized map
+    lookup_hits = 0
+    source_lookup = len(col_to_process) == 1 and bool(row_data)
+    if source_lookup:
+        source_column = col_to_process[0]
+        distinct_df = pd.DataFrame(row_data)
+        lookup_keys = normalize_lookup_values(distinct_df[source_column])
+        mappings = await run_in_threadpool(
+            lookup_index.get_mappings, source_column, user_defined_columns, lookup_keys.unique().tolist()
+        )
+        looked_up = pd.DataFrame({col: lookup_keys.map(mappings[col]) for col in user_defined_columns})
+        # Learned answers must still fit this request's schema and allowed values;
+        # rows with a value that does not are sent to the model instead
+        if schema:
+            looked_up = conform_frame(looked_up, schema)
+        for col, vocabulary in (vocabularies or {}).items():
+            if col in looked_up:
+                allowed = looked_up[col].astype("string").str.strip().str.casefold().isin(vocabulary)
+                looked_up[col] = looked_up[col].where(allowed, None)
+        complete = looked_up.notna().all(axis=1)
+        resolved_ids = distinct_df.loc[complete, "__row_id__"].to_numpy()
+        for col in user_defined_columns:
+            outputs[col][resolved_ids] = looked_up.loc[complete, col].to_numpy()
+        lookup_hits = len(resolved_ids)
+        row_data = [row for row, resolved in zip(row_data, complete) if not resolved]
+    
+    # Look every row up in the persistent cache and only send misses to the model
+    models = cascade_models()
+    row_keys = {
+        row["__row_id__"]: row_cache_key(
+            {col: row[col] for col in col_to_process}, user_defined_columns, "+".join(models), schema
+        )
+        for row in row_data
+    }
+    cached = await run_in_threadpool(row_cache.get_many, list(row_keys.values()))
+    all_results = [
+        {"__row_id__": row["__row_id__"], **cached[row_keys[row["__row_id__"]]]}
+        for row in row_data if row_keys[row["__row_id__"]] in cached
+    ]
+    uncached_rows = [row for row in row_data if row_keys[row["__row_id__"]] not in cached]
+    
+    # Resume: rows completed by a previous failed attempt of this run are not sent again
+    checkpointed = await run_in_threadpool(checkpoint_store.load, checkpoint_key)
+    resumed_results = [checkpointed[row["__row_id__"]] for row in uncached_rows if row["__row_id__"] in checkpointed]
+    pending_rows = [row for row in uncached_rows if row["__row_id__"] not in checkpointed]
+    
+    # Batches are packed by estimated tokens when a worker picks them up, so
+    # budget changes from earlier responses apply to the rest of the run.
+    # Each cascade tier runs over the rows the previous tier could not answer
+    planner = BatchPlanner([], user_defined_columns, get_token_budget(LLM_MODEL))
+    tier_rows = {model: 0 for model in models}
+    batch_results = []
+    batches_done = 0
+    in_flight = 0
+    rows_done = distinct_rows - len(pending_rows)
+    counters = {}
+    counters_token = run_counters.set(counters)
+    started = time.monotonic()
+    
+    def report_progress():
+        if not progress:
+            return
+        batches_total = batches_done + in_flight + planner.estimated_batches_left()
+        elapsed = time.monotonic() - started
+        progress({
+            "state": "running",
+            "batches_done": batches_done,
+            "batches_total": batches_total,
+            "rows_done": rows_done,
+            "rows_total": distinct_rows,
+            "tokens": counters.get("tokens", 0),
+            "retries": counters.get("retries", 0),
+            "failed_rows": counters.get("failed_rows", 0),
+            "eta_seconds": round(elapsed / batches_done * (batches_total - batches_done), 1) if batches_done else None,
+        })
+    
+    async def worker(model: str, final: bool, escalated: list):
+        nonlocal batches_done, in_flight, rows_done
+        while True:
+            with stage("batch_build"):
+                batch = planner.next_batch()
+            if not batch:
+                return
+            in_flight += 1
+            BATCHES_IN_FLIGHT.inc()
+            try:
+                normalized_rows = await enrich_batch(
+                    batch, user_defined_columns, planner.budget, model, split_failures=final, schema=schema
+                )
+            finally:
+                in_flight -= 1
+                BATCHES_IN_FLIGHT.dec()
+            if not final:
+                hard = {r["__row_id__"] for r in normalized_rows
+                        if needs_escalation(r, user_defined_columns, vocabularies or {})}
+                escalated.extend(row for row in batch if row["__row_id__"] in hard)
+                normalized_rows = [r for r in normalized_rows if r["__row_id__"] not in hard]
+            await run_in_threadpool(checkpoint_store.save, checkpoint_key, normalized_rows)
+            batch_results.append(normalized_rows)
+            tier_rows[model] += len(normalized_rows)
+            batches_done += 1
+            rows_done += len(normalized_rows)
+            report_progress()
+    
+    tier_input = pending_rows
+    try:
+        for tier, model in enumerate(models):
+            if not tier_input:
+                break
+            planner = BatchPlanner(
+                tier_input, user_defined_columns, get_token_budget(model), positional=bool(schema)
             )
+            report_progress()
+            escalated = []
+            final = tier == len(models) - 1
+            await gather_or_cancel(*(worker(model, final, escalated) for _ in range(MAX_CONCURRENT_BATCHES)))
+            tier_input = escalated
+    finally:
+        run_counters.reset(counters_token)
+    
+    fresh_results = list(resumed_results)
+    for normalized_rows in batch_results:
+        fresh_results.extend(normalized_rows)
+    
+    await run_in_threadpool(row_cache.set_many, {
+        row_keys[r["__row_id__"]]: {col: r.get(col) for col in user_defined_columns}
+        for r in fresh_results
+        if any(r.get(col) is not None for col in user_defined_columns)
+    })
+    await run_in_threadpool(checkpoint_store.clear, checkpoint_key)
+    if source_lookup:
+        key_by_row = dict(zip(distinct_df["__row_id__"], lookup_keys))
+        await run_in_threadpool(lookup_index.harvest, source_column, {
+            key_by_row[r["__row_id__"]]: {col: r.get(col) for col in user_defined_columns}
+            for r in fresh_results
+        })
+    
+    all_results.extend(fresh_results)
+
+    with stage("concat"):
+        for r in all_results:
+            for col in user_defined_columns:
+                outputs[col][r["__row_id__"]] = r.get(col)
+        for col in user_defined_columns:
+            df[col] = outputs[col][group_ids]
+        for col in derived_df.columns:
+            df[col] = derived_df[col]
+    return {
+        "updated_df": df,
+        "non_empty_columns": non_empty_columns(outputs, derived_df),
+        "distinct_rows": distinct_rows,
+        "lookup_hits": lookup_hits,
+        "tier_rows": tier_rows,
+        "cache_hits": len(row_data) - len(uncached_rows),
+        "resumed_rows": len(resumed_results),
+        "tokens": counters.get("tokens", 0),
+        "batches": batches_done
+    }
+
+
+async def enrich_incremental(df: pd.DataFrame, previous: pd.DataFrame, col_to_process: list,
+                             user_defined_columns: list, run_contents: bytes, progress=None,
+                             expressions: dict = None, vocabularies: dict = None, schema: dict = None):
+    """Enrich df, reusing the values of a previous enriched output of the same data.
+    
+    Rows whose source values hash the same as a row of previous keep its values,
+    so only new or changed rows go to the model. New columns previous lacks, and
+    columns left null or blank in previous, are generated for the unchanged rows
+    without regenerating the columns they have.
+    run_contents identifies the run for checkpoints. Returns the same dict as
+    enrich_frame, with the number of reused_rows added.
+    """
+    with stage("diff"):
+        matched, reused, _ = await run_in_threadpool(
+            match_previous, df, previous, col_to_process, user_defined_columns
+        )
+    outputs = {col: reused.get(col, np.full(len(df), None, dtype=object)) for col in user_defined_columns}
+    stats = {"distinct_rows": 0, "lookup_hits": 0, "cache_hits": 0, "resumed_rows": 0, "tokens": 0, "batches": 0}
+    model_chain = "+".join(cascade_models())
+    tier_rows = {}
+    
+    # Every column without a value is pending: all of them for changed rows, and the
+    # ones previous lacks or left empty for unchanged rows. Rows pending the same
+    # columns are enriched together
+    if user_defined_columns:
+        pending = np.column_stack([pd.isna(outputs[col]) for col in user_defined_columns])
+        patterns, row_patterns = np.unique(pending, axis=0, return_inverse=True)
+        row_patterns = row_patterns.reshape(-1)
+    else:
+        patterns, row_patterns = [], None
+    for index, pattern in enumerate(patterns):
+        columns = [col for col, needed in zip(user_defined_columns, pattern) if needed]
+        if not columns:
+            continue
+        positions = np.flatnonzero(row_patterns == index)
+        part = df[col_to_process].iloc[positions].reset_index(drop=True)
+        part_schema = {col: schema[col] for col in columns} if schema else None
+        enriched = await enrich_frame(
+            part, col_to_process, columns, progress,
+            checkpoint_run_key(run_contents, col_to_process, columns, model_chain, part_schema),
+            vocabularies=vocabularies, schema=part_schema
+        )
+        for col in columns:
+            outputs[col][positions] = enriched["updated_df"][col].to_numpy(dtype=object)
+        for name in stats:
+            stats[name] += enriched[name]
+        for model, rows in enriched["tier_rows"].items():
+            tier_rows[model] = tier_rows.get(model, 0) + rows
+    
+    derived_df = await run_in_threadpool(apply_derived_columns, df, expressions or {})
+    with stage("concat"):
+        for col in user_defined_columns:
+            df[col] = outputs[col]
+        for col in derived_df.columns:
+            df[col] = derived_df[col]
+    return {
+        "updated_df": df,
+        "non_empty_columns": non_empty_columns(outputs, derived_df),
+        "tier_rows": tier_rows,
+        "reused_rows": int(matched.sum()),
+        **stats
+    }
+
+
+async def read_upload(contents: bytes, max_size_mb: int = MAX_FILE_SIZE_MB):
+    """Check the size of an upload and parse it; returns the DataFrame or a JSONResponse.
+    
+    The size limit applies to the upload and again to its decompressed payload.
+    """
+    max_bytes = max_size_mb * 1024 * 1024
+    too_large = JSONResponse(
+        status_code=400,
+        content={
+            "status": "error",
+            "message": f"File size exceeds maximum allowed size of {max_size_mb}MB"
+        }
+    )
+    if len(contents) > max_bytes:
+        return too_large
+    
+    # CSV, JSONL, Parquet and Arrow IPC are detected from their leading bytes,
+    # optionally wrapped in gzip or zstd compression
+    try:
+        with stage("decode"):
+            payload, input_format = await run_in_threadpool(decompress, contents, max_bytes)
+        with stage("parse"):
+            df = await run_in_threadpool(read_frame, payload, input_format)
+    except PayloadTooLargeError:
+        return too_large
+    except Exception as e:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": "The file could not be parsed as CSV, JSONL, Parquet or Arrow"}
+        )
+    
+    if df.empty:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": "The CSV is empty, no rows to process"}
+        )
+    return df
+
+
+async def process_csv(contents: bytes, columns: str = None, new_columns: str = None, progress=None,
+                      derived_columns: str = None, allowed_values: str = None, column_schema: str = None,
+                      previous: bytes = None):
+    """Enrich an uploaded file.
+    
+    previous, if given, is an earlier enriched output of the same data: only new or
+    changed rows, and new columns it lacks, are generated.
+    """
+    try:
+        df = await read_upload(contents)
+        if isinstance(df, JSONResponse):
+            return df
         
-        csv_text = contents.decode("utf-8")
+        resolved = await resolve_request(df, columns, new_columns, derived_columns)
+        if isinstance(resolved, JSONResponse):
+            return resolved
+        col_to_process, user_defined_columns, expressions = resolved
+        rules = parse_answer_rules(allowed_values, column_schema, user_defined_columns, expressions)
+        if isinstance(rules, JSONResponse):
+            return rules
+        vocabularies, schema = rules
         
-        df = pd.read_csv(io.StringIO(csv_text))
-     
-        if df.empty:
-            return JSONResponse(
-                status_code=400,
-                content={"status": "error", "message": "The CSV is empty, no rows to process"}
+        if previous is not None:
+            previous_df = await read_upload(previous, PREVIOUS_MAX_FILE_SIZE_MB)
+            if isinstance(previous_df, JSONResponse):
+                message = json.loads(previous_df.body)["message"]
+                return JSONResponse(
+                    status_code=400, content={"status": "error", "message": f"Previous output: {message}"}
+                )
+            missing = [col for col in col_to_process if col not in previous_df.columns]
+            if missing:
+                return JSONResponse(
+                    status_code=400,
+                    content={
+                        "status": "error",
+                        "message": f"The previous output lacks the source columns: {', '.join(missing)}"
+                    }
+                )
+            enriched = await enrich_incremental(
+                df, previous_df, col_to_process, user_defined_columns, contents + previous, progress,
+                expressions, vocabularies, schema
             )
-        
-        df = df.reset_index(drop=True)
-        df["__row_id__"] = df.index
-        
-        existing_columns = df.columns.tolist()
-        if columns:
-            col_to_process = [column.strip() for column in columns.split(",")]
         else:
-            col_to_process = df.select_dtypes(include='object').columns.tolist()
-        
-        missing_cols = [col for col in col_to_process if col not in df.columns.tolist()]
-        if missing_cols:
-            return JSONResponse(
-                status_code=400,
-                content={
-                    "status": "error",
-                    "message": f"The following source columns do not exist in the CSV: {', '.join(missing_cols)}"
-                }
+            checkpoint_key = checkpoint_run_key(
+                contents, col_to_process, user_defined_columns, "+".join(cascade_models()), schema
             )
-        
-        duplicates = df.columns[df.columns.duplicated()].tolist()
-        if duplicates:
-            return JSONResponse(
-                status_code=400,
-                content={
-                    "status": "error",
-                    "message": f"CSV contains duplicate columns: {', '.join(duplicates)}"
-                }
+            enriched = await enrich_frame(
+                df, col_to_process, user_defined_columns, progress, checkpoint_key, expressions, vocabularies, schema
             )
         
-        if not col_to_process:
-            return JSONResponse(
-                status_code=400,
-                content={"status": "error", "message": "No columns to process"}
+        non_empty = enriched["non_empty_columns"]
+        return {
+        "updated_df": enriched["updated_df"],
+        "generated_anything": non_empty.any(),
+        # Reported to callers as response metadata
+        "stats": {
+            "distinct_rows": enriched["distinct_rows"],
+            "lookup_hits": enriched["lookup_hits"],
+            "cache_hits": enriched["cache_hits"],
+            "resumed_rows": enriched["resumed_rows"],
+            "reused_rows": enriched.get("reused_rows", 0),
+            "tier_rows": enriched["tier_rows"],
+        },
+        "partial_enrichment": (
+            non_empty.any() and not non_empty.all()
+        )
+    }
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"status": "error", "message": "Internal server error"}
+        )
+
+
+async def process_bulk(uploads: list, columns: str = None, new_columns: str = None, progress=None,
+                       derived_columns: str = None, allowed_values: str = None, column_schema: str = None):
+    """Enrich several files with one request spec as a single run.
+    
+    uploads is a list of (filename, bytes); zips are expanded into their files.
+    Rows of all files are stacked into one frame, so batches fill up across file
+    boundaries and values repeated in several files are enriched once. Returns
+    the enriched frames as [(filename, DataFrame)] with run statistics, or a JSONResponse.
+    """
+    try:
+        try:
+            files = await run_in_threadpool(
+                expand_archives, uploads, MAX_FILE_SIZE_BYTES, BULK_MAX_FILES, BULK_MAX_TOTAL_BYTES
             )
+        except (ValueError, zipfile.BadZipFile) as e:
+            return JSONResponse(status_code=400, content={"status": "error", "message": str(e)})
+        if not files:
+            return JSONResponse(status_code=400, content={"status": "error", "message": "No files to process"})
         
-        df[col_to_process] = df[col_to_process].fillna("")
+        frames = []
+        for filename, contents in files:
+            df = await read_upload(contents)
+            # Every file must carry the requested source columns
+            error = df if isinstance(df, JSONResponse) else resolve_columns(df, columns, new_columns)
+            if isinstance(error, JSONResponse):
+                message = json.loads(error.body)["message"]
+                return JSONResponse(status_code=400, content={"status": "error", "message": f"{filename}: {message}"})
+            frames.append(df)
         
-        if new_columns:
-            user_defined_columns = [col.strip() for col in new_columns.split(",")]
-        else:
-            user_defined_columns = []
-       
-        batch_size = BATCH_SIZE
+        # Derived expressions are written against the first file's sample rows
+        resolved = await resolve_request(frames[0], columns, new_columns, derived_columns)
+        if isinstance(resolved, JSONResponse):
+            return resolved
+        col_to_process, user_defined_columns, expressions = resolved
+        rules = parse_answer_rules(allowed_values, column_schema, user_defined_columns, expressions)
+        if isinstance(rules, JSONResponse):
+            return rules
+        vocabularies, schema = rules
         
-        all_results = []
-        row_data = df[col_to_process + ["__row_id__"]].to_dict(orient="records")
-        batches = list(chunk_list(row_data, batch_size))
+        # Every row keeps its file through its position in the stacked frame
+        with stage("concat"):
+            combined = pd.concat(frames, ignore_index=True)
+            offsets = np.cumsum([0] + [len(df) for df in frames])
+        checkpoint_key = checkpoint_run_key(
+            b"".join(contents for _, contents in files), col_to_process, user_defined_columns,
+            "+".join(cascade_models()), schema
+        )
+        enriched = await enrich_frame(
+            combined, col_to_process, user_defined_columns, progress, checkpoint_key, expressions, vocabularies, schema
+        )
         
-        for idx, batch in enumerate(batches):
-            prompt = PROMPT_TEMPLATE.format(
-                batch=json.dumps(batch, indent=2),
-                user_defined_columns=user_defined_columns
-            )
-            
-            response = client.chat.completions.create(
-                model=LLM_MODEL,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
-            )
-            output_text = response.choices[0].message.content
-            clean = output_text.replace("```", "").strip()
-            print(clean)
-            
-            try:
-                result = json.loads(clean)
-            except json.JSONDecodeError:
-                return JSONResponse(
-                    status_code=500,
-                    content={
-                            "status": "error",
-                            "detail":"AI response format error",
-                            "message": "The model returned malformed data for one of the batches. Please simplify column names or retry."
-                             })
-    
-            # Ensure result is a list of dict
-            if not isinstance(result, list) or not all(isinstance(r, dict) for r in result):
-                return JSONResponse(
-                    status_code=500,
-                    content={
-                        "status": "error",
-                        "detail":"AI response format error",
-                        
-                        "message": "The AI model returned data in an unexpected format."
-                        })
-                
-            model_rows = {r["__row_id__"]: r for r in result if "__row_id__" in r}
-            normalized_rows = []
-            for row in batch:
-                rid = row["__row_id__"]
-                if rid in model_rows:
-                    normalized_rows.append(model_rows[rid])
-                else:
-                    normalized_rows.append({
-                        "__row_id__": rid,
-                        **{col: None for col in user_defined_columns}
-                        })
-
-
-    
-          
-                
-            all_results.extend(normalized_rows)
+        added = [col for col in combined.columns if col in user_defined_columns or col in expressions]
+        outputs = []
+        for (filename, _), df, start, end in zip(files, frames, offsets[:-1], offsets[1:]):
+            part = combined.iloc[start:end].reset_index(drop=True)
+            outputs.append((filename, part[[col for col in df.columns if col not in added] + added]))
+        
+        non_empty = enriched["non_empty_columns"]
+        return {
+            "outputs": outputs,
+            "generated_anything": non_empty.any(),
+            "stats": {
+                "files": len(files),
+                "distinct_rows": enriched["distinct_rows"],
+                "lookup_hits": enriched["lookup_hits"],
+                "cache_hits": enriched["cache_hits"],
+                "resumed_rows": enriched["resumed_rows"],
+                "tier_rows": enriched["tier_rows"],
+            },
+            "partial_enrichment": non_empty.any() and not non_empty.all()
+        }
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"status": "error", "message": "Internal server error"}
+        )
+
+
+async def preview_csv(contents: bytes, sample_rows: int, columns: str = None, new_columns: str = None,
+                      derived_columns: str = None, allowed_values: str = None, column_schema: str = None):
+    """Enrich a small sample of distinct rows and project the cost of the full run.
     
+    Returns {"rows": enriched sample records, "stats": sample run statistics,
+    "estimates": full-run projections} or a JSONResponse.
+    """
+    try:
+        df = await read_upload(contents)
+        if isinstance(df, JSONResponse):
+            return df
         
-        df = df.drop(columns=["__row_id__"])
-        new_df = pd.DataFrame(all_results).drop(columns=["__row_id__"])
-        updated = pd.concat([df, new_df], axis=1)
-        generated_anything = (new_df[user_defined_columns]
-        .replace(r"^\s*$", pd.NA, regex=True)                    
-        .notna()
-        .any()
-        .any())
+        resolved = await resolve_request(df, columns, new_columns, derived_columns)
+        if isinstance(resolved, JSONResponse):
+            return resolved
+        col_to_process, user_defined_columns, expressions = resolved
+        rules = parse_answer_rules(allowed_values, column_schema, user_defined_columns, expressions)
+        if isinstance(rules, JSONResponse):
+            return rules
+        vocabularies, schema = rules
         
-        non_empty_columns = (new_df[user_defined_columns]
-                             .replace(r"^\s*$", pd.NA, regex=True)
-                             .notna()
-                             .any()
-                             )
-        return {
-        "updated_df": updated,
-        "generated_anything": generated_anything,
-        "partial_enrichment": (
-            non_empty_columns.any() and not non_empty_columns.all()
+        positions, group_counts = await run_in_threadpool(
+            sample_distinct_rows, df, col_to_process, min(sample_rows, PREVIEW_MAX_ROWS)
         )
-    }
+        sample = df.iloc[positions].reset_index(drop=True)
+        prompt_rows = sample[col_to_process].astype(object).to_dict(orient="records")
+        started = time.perf_counter()
+        enriched = await enrich_frame(
+            sample, col_to_process, user_defined_columns,
+            expressions=expressions, vocabularies=vocabularies, schema=schema
+        )
+        elapsed = time.perf_counter() - started
+        return {
+            "rows": json.loads(enriched["updated_df"].to_json(orient="records", date_format="iso")),
+            "stats": {
+                "distinct_rows": enriched["distinct_rows"],
+                "lookup_hits": enriched["lookup_hits"],
+                "cache_hits": enriched["cache_hits"],
+                "tier_rows": enriched["tier_rows"],
+                "tokens": enriched["tokens"],
+                "seconds": round(elapsed, 2),
+            },
+            "estimates": estimate_full_run(
+                len(df), group_counts, prompt_rows, enriched, user_defined_columns, elapsed, bool(schema)
+            )
+        }
     except Exception as e:
         return JSONResponse(
             status_code=500,
             content={"status": "error", "message": "Internal server error"}
-        )
\ No newline at end of file
+        )
+
+
+def _next_chunk(reader):
+    """Read the next DataFrame chunk, returning None once the CSV is exhausted."""
+    return next(reader, None)
+
+
+async def stream_csv(file_obj, columns: str = None, new_columns: str = None, derived_columns: str = None,
+                     allowed_values: str = None, column_schema: str = None, progress=None):
+    """Enrich a CSV file object chunk by chunk without loading it into memory.
+    
+    Validation runs on the first chunk so errors can still be reported as a
+    JSONResponse; otherwise an async generator of enriched CSV text is returned.
+    progress, if given, receives the same events as enrich_frame's, counted over
+    the whole upload; totals only cover the chunks read so far and no ETA is given.
+    """
+    input_format = detect_input_format(file_obj.read(8))
+    file_obj.seek(0)
+    if input_format not in ("csv", "gzip"):
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": "Streaming supports plain or gzip-compressed CSV only"}
+        )
+    try:
+        reader = await run_in_threadpool(
+            # The pyarrow engine cannot read in chunks, but chunks still get Arrow-backed dtypes
+            pd.read_csv, file_obj, chunksize=STREAM_CHUNK_ROWS, encoding="utf-8", dtype_backend="pyarrow",
+            compression="gzip" if input_format == "gzip" else None
+        )
+        first_chunk = await run_in_threadpool(_next_chunk, reader)
+    except Exception as e:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": "The file could not be parsed as CSV"}
+        )
+    
+    if first_chunk is None or first_chunk.empty:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": "The CSV is empty, no rows to process"}
+        )
+    
+    resolved = await resolve_request(first_chunk, columns, new_columns, derived_columns)
+    if isinstance(resolved, JSONResponse):
+        return resolved
+    col_to_process, user_defined_columns, expressions = resolved
+    rules = parse_answer_rules(allowed_values, column_schema, user_defined_columns, expressions)
+    if isinstance(rules, JSONResponse):
+        return rules
+    vocabularies, schema = rules
+    
+    # enrich_frame counts restart with every chunk; add those of the chunks already sent
+    totals = {"batches_done": 0, "rows_done": 0, "tokens": 0, "retries": 0, "failed_rows": 0}
+    latest = {}
+    
+    def chunk_progress(event):
+        latest.update(event)
+        progress({
+            **event,
+            **{name: totals[name] + event[name] for name in totals},
+            "batches_total": totals["batches_done"] + event["batches_total"],
+            "rows_total": totals["rows_done"] + event["rows_total"],
+            "eta_seconds": None,
+        })
+    
+    async def generate():
+        chunk = first_chunk
+        header = True
+        while chunk is not None:
+            enriched = await enrich_frame(
+                chunk, col_to_process, user_defined_columns, chunk_progress if progress else None,
+                expressions=expressions, vocabularies=vocabularies, schema=schema
+            )
+            if progress:
+                totals["batches_done"] += enriched["batches"]
+                totals["rows_done"] += enriched["distinct_rows"]
+                totals["tokens"] += enriched["tokens"]
+                totals["retries"] += latest.get("retries", 0)
+                totals["failed_rows"] += latest.get("failed_rows", 0)
+                latest.clear()
+                progress({"state": "running", **totals, "batches_total": totals["batches_done"],
+                          "rows_total": totals["rows_done"], "eta_seconds": None})
+            with stage("serialize"):
+                text = enriched["updated_df"].to_csv(index=False, header=header)
+            yield text
+            header = False
+            with stage("parse"):
+                chunk = await run_in_threadpool(_next_chunk, reader)
+        reader.close()
+    
+    return generate()
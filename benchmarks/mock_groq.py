@@ -0,0 +1,176 @@
+"""
+Local stand-in for the Groq chat-completions API used by the benchmark suite.
+
+Answers every batch with one object (or, for column schema requests, one
+positional array) per input row, streamed like the real
+API, with configurable latency, token-proportional delay, malformed
+responses and injected 429s. GET /stats reports per-request latency and
+token counts; POST /reset clears them between scenarios.
+
+    python -m benchmarks.mock_groq --port 8765 --latency-ms 300 --malformed-rate 0.02
+"""
+
+import json
+import time
+import zlib
+import random
+import asyncio
+import argparse
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse, JSONResponse
+
+CHARS_PER_TOKEN = 4
+
+settings = {
+    "latency_ms": 200.0,
+    "token_delay_ms": 0.5,
+    "malformed_rate": 0.0,
+    "rate_limit_rate": 0.0,
+    "retry_after": 1.0,
+}
+stats = {}
+
+app = FastAPI()
+
+
+def reset_stats():
+    stats.update(requests=0, rate_limited=0, malformed=0, prompt_tokens=0, completion_tokens=0, latencies_ms=[])
+
+
+reset_stats()
+
+
+def parse_batch(messages: list):
+    """Pull rows and requested columns out of the compact user message."""
+    content = messages[-1]["content"]
+    rows_text, _, columns_text = content.partition("\n\nREQUESTED NEW COLUMNS:\n")
+    payload = json.loads(rows_text.split("INPUT ROWS:\n", 1)[1])
+    return payload["rows"], json.loads(columns_text)
+
+
+def value(column, row: list):
+    """Deterministic answer for one column; schema columns (dicts) get a value of their type."""
+    digest = zlib.crc32(json.dumps(row[1:]).encode()) % 97
+    if not isinstance(column, dict):
+        return f"{column}-{digest}"
+    if column.get("enum"):
+        return column["enum"][digest % len(column["enum"])]
+    return {"integer": digest, "number": digest / 4, "boolean": digest % 2 == 0}.get(
+        column["type"], f"{column['name']}-{digest}"
+    )
+
+
+def answer(rows: list, columns: list):
+    if columns and isinstance(columns[0], dict):
+        # Positional output for requests that declare a column schema
+        return json.dumps({"rows": [[row[0]] + [value(col, row) for col in columns] for row in rows]})
+    return json.dumps([{"__row_id__": row[0], **{col: value(col, row) for col in columns}} for row in rows])
+
+
+def chunk(model: str, content: str = None, finish_reason: str = None, usage: dict = None):
+    body = {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": {"content": content} if content else {}, "finish_reason": finish_reason}],
+    }
+    if usage:
+        body["x_groq"] = {"id": "req-mock", "usage": usage, "error": None}
+    return f"data: {json.dumps(body)}\n\n"
+
+
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    started = time.perf_counter()
+    body = await request.json()
+    stats["requests"] += 1
+    prompt_tokens = sum(len(m["content"]) for m in body["messages"]) // CHARS_PER_TOKEN
+    stats["prompt_tokens"] += prompt_tokens
+
+    if random.random() < settings["rate_limit_rate"]:
+        stats["rate_limited"] += 1
+        return JSONResponse(
+            status_code=429,
+            headers={"retry-after": str(settings["retry_after"])},
+            content={"error": {"message": "Rate limit reached", "type": "tokens", "code": "rate_limit_exceeded"}}
+        )
+
+    try:
+        rows, columns = parse_batch(body["messages"])
+        content = answer(rows, columns)
+    except (ValueError, KeyError, IndexError):
+        # Non-batch prompts, e.g. derived column expressions
+        rows, content = [], "NONE"
+    if rows and random.random() < settings["malformed_rate"]:
+        stats["malformed"] += 1
+        content = "Sure! Here is the data: " + content[: len(content) // 2]
+
+    completion_tokens = len(content) // CHARS_PER_TOKEN
+    stats["completion_tokens"] += completion_tokens
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+    model = body.get("model", "mock")
+
+    if not body.get("stream"):
+        await asyncio.sleep(settings["latency_ms"] / 1000 + completion_tokens * settings["token_delay_ms"] / 1000)
+        stats["latencies_ms"].append((time.perf_counter() - started) * 1000)
+        return {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+
+    async def events():
+        await asyncio.sleep(settings["latency_ms"] / 1000)
+        piece = 64
+        for i in range(0, len(content), piece):
+            await asyncio.sleep(len(content[i:i + piece]) / CHARS_PER_TOKEN * settings["token_delay_ms"] / 1000)
+            yield chunk(model, content[i:i + piece])
+        yield chunk(model, finish_reason="stop", usage=usage)
+        yield "data: [DONE]\n\n"
+        stats["latencies_ms"].append((time.perf_counter() - started) * 1000)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+@app.post("/reset")
+async def post_reset():
+    reset_stats()
+    return {"status": "ok"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=settings["latency_ms"])
+    parser.add_argument("--token-delay-ms", type=float, default=settings["token_delay_ms"])
+    parser.add_argument("--malformed-rate", type=float, default=settings["malformed_rate"])
+    parser.add_argument("--rate-limit-rate", type=float, default=settings["rate_limit_rate"])
+    parser.add_argument("--retry-after", type=float, default=settings["retry_after"])
+    args = parser.parse_args()
+    settings.update(
+        latency_ms=args.latency_ms,
+        token_delay_ms=args.token_delay_ms,
+        malformed_rate=args.malformed_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
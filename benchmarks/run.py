@@ -0,0 +1,185 @@
+"""
+Offline benchmark of the enrichment pipeline against the local mock Groq server.
+
+Starts benchmarks.mock_groq, then runs every combination of row count, token
+budget and concurrency in its own subprocess (so peak RSS is per scenario),
+posting a synthetic CSV to /upload_file through the ASGI app in backend.main.
+Prints one comparable row per scenario.
+
+    python -m benchmarks.run --rows 1000 10000 100000 --concurrency 1 5 10
+    python -m benchmarks.run --rows 1000000 --cardinality 0.05 --malformed-rate 0.01
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+import statistics
+import urllib.request
+
+WORDS = ("fast reliable cheap broken premium fragile wireless organic refurbished compact "
+         "durable stylish noisy heavy portable waterproof vintage smart eco-friendly basic").split()
+CITIES = ["Paris", "Tokyo", "New York", "Sydney", "Lagos", "Lima", "Oslo", "Pune", "Cairo", "Toronto"]
+
+
+def synthetic_csv(rows: int, cardinality: float, seed: int = 7):
+    """CSV with a free-text description column; cardinality is the share of distinct descriptions."""
+    rng = random.Random(seed)
+    distinct = max(1, int(rows * cardinality))
+    descriptions = [" ".join(rng.choices(WORDS, k=rng.randint(3, 20))) + f" #{i}" for i in range(distinct)]
+    out = io.StringIO()
+    out.write("id,city,description\n")
+    for i in range(rows):
+        out.write(f'{i},{rng.choice(CITIES)},"{descriptions[rng.randrange(distinct)]}"\n')
+    return out.getvalue().encode()
+
+
+async def run_scenario(rows: int, cardinality: float, new_columns: str):
+    """Runs inside the scenario subprocess, with configuration already in the environment."""
+    import httpx
+    from backend.main import app
+
+    contents = synthetic_csv(rows, cardinality)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        started = time.perf_counter()
+        response = await client.post(
+            "/upload_file",
+            files={"file": ("bench.csv", contents, "text/csv")},
+            data={"columns": "description", "new_columns": new_columns},
+        )
+        elapsed = time.perf_counter() - started
+    return {
+        "status": response.status_code,
+        "content_type": response.headers.get("content-type", ""),
+        "wall_s": elapsed,
+        "input_mb": len(contents) / 1024 / 1024,
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024),
+    }
+
+
+def http(url: str, method: str = "GET"):
+    request = urllib.request.Request(url, method=method, data=b"" if method == "POST" else None)
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return json.loads(response.read())
+
+
+def wait_for_mock(base_url: str, timeout: float = 15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            return http(f"{base_url}/stats")
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("Mock Groq server did not start")
+
+
+def percentile(values: list, pct: float):
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(pct) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--budgets", type=int, nargs="+", default=[6000], help="BATCH_TOKEN_BUDGET values")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[5], help="MAX_CONCURRENT_BATCHES values")
+    parser.add_argument("--max-batch-rows", type=int, default=200)
+    parser.add_argument("--cardinality", type=float, default=1.0, help="Share of distinct source values")
+    parser.add_argument("--new-columns", default="category,sentiment")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--token-delay-ms", type=float, default=0.5)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        rows, cardinality = args.scenario.split(":")
+        result = asyncio.run(run_scenario(int(rows), float(cardinality), args.new_columns))
+        print(json.dumps(result))
+        return
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    mock = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.mock_groq", "--port", str(args.port),
+        "--latency-ms", str(args.latency_ms), "--token-delay-ms", str(args.token_delay_ms),
+        "--malformed-rate", str(args.malformed_rate), "--rate-limit-rate", str(args.rate_limit_rate),
+    ])
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    try:
+        wait_for_mock(base_url)
+        for rows in args.rows:
+            for budget in args.budgets:
+                for concurrency in args.concurrency:
+                    http(f"{base_url}/reset", "POST")
+                    with tempfile.TemporaryDirectory() as workdir:
+                        env = dict(
+                            os.environ,
+                            PYTHONPATH=repo_root,
+                            GROQ_API_KEY="mock",
+                            GROQ_API_KEYS="",
+                            GROQ_BASE_URL=base_url,
+                            BATCH_TOKEN_BUDGET=str(budget),
+                            MAX_CONCURRENT_BATCHES=str(concurrency),
+                            MAX_BATCH_ROWS=str(args.max_batch_rows),
+                            MAX_FILE_SIZE_MB="100000",
+                            LLM_RETRY_BACKOFF_SECONDS="0.1",
+                            CACHE_ENABLED="false",
+                            LOOKUP_ENABLED="false",
+                            CHECKPOINT_ENABLED="false",
+                            JOBS_DIR=os.path.join(workdir, "jobs"),
+                        )
+                        completed = subprocess.run(
+                            [sys.executable, "-m", "benchmarks.run", "--scenario", f"{rows}:{args.cardinality}",
+                             "--new-columns", args.new_columns],
+                            env=env, cwd=workdir, capture_output=True, text=True
+                        )
+                    if completed.returncode != 0:
+                        print(completed.stderr, file=sys.stderr)
+                        continue
+                    scenario = json.loads(completed.stdout.strip().splitlines()[-1])
+                    mock_stats = http(f"{base_url}/stats")
+                    results.append({
+                        "rows": rows,
+                        "budget": budget,
+                        "concurrency": concurrency,
+                        **scenario,
+                        "requests": mock_stats["requests"],
+                        "p50_ms": percentile(mock_stats["latencies_ms"], 50),
+                        "p99_ms": percentile(mock_stats["latencies_ms"], 99),
+                        "prompt_tokens": mock_stats["prompt_tokens"],
+                        "completion_tokens": mock_stats["completion_tokens"],
+                        "rate_limited": mock_stats["rate_limited"],
+                        "malformed": mock_stats["malformed"],
+                    })
+    finally:
+        mock.terminate()
+        mock.wait()
+
+    header = f"{'rows':>9} {'budget':>7} {'conc':>5} {'status':>6} {'wall s':>8} {'rows/s':>9} {'reqs':>6} " \
+             f"{'p50 ms':>8} {'p99 ms':>8} {'rss MB':>8} {'prompt tok':>11} {'compl tok':>10} {'429s':>5} {'bad':>4}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['rows']:>9} {r['budget']:>7} {r['concurrency']:>5} {r['status']:>6} {r['wall_s']:>8.2f} "
+              f"{r['rows'] / r['wall_s']:>9.0f} {r['requests']:>6} {r['p50_ms']:>8.0f} {r['p99_ms']:>8.0f} "
+              f"{r['peak_rss_mb']:>8.0f} {r['prompt_tokens']:>11} {r['completion_tokens']:>10} "
+              f"{r['rate_limited']:>5} {r['malformed']:>4}")
+
+
+if __name__ == "__main__":
+    main()
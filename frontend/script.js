@@ -2,6 +2,7 @@
 
 // 👉 Replace this with your FastAPI endpoint
 const API_URL = "http://127.0.0.1:8000/upload_file";
+const PROGRESS_URL = "http://127.0.0.1:8000/progress";
 
 const sourceColumnInput = document.getElementById("sourceColumn");
 const newColumnInput = document.getElementById("newColumn");
@@ -12,6 +13,9 @@ const fileInfo = document.getElementById("fileInfo");
 const processBtn = document.getElementById("processBtn");
 const loader = document.getElementById("loader");
 const message = document.getElementById("message");
+const progressBox = document.getElementById("progress");
+const progressFill = document.getElementById("progressFill");
+const progressText = document.getElementById("progressText");
 const sourceColumn = sourceColumnInput.value.trim();
 const newColumn = newColumnInput.value.trim();
 
@@ -73,10 +77,14 @@ processBtn.addEventListener("click", async () => {
   toggleLoading(true);
   processBtn.disabled = true;
 
+const progressId = crypto.randomUUID();
+const events = watchProgress(progressId);
+
 const formData = new FormData();
 formData.append("file", selectedFile);
 formData.append("columns", sourceColumn);
 formData.append("new_columns", newColumn);
+formData.append("progress_id", progressId);
 
 
   try {
@@ -106,11 +114,45 @@ formData.append("new_columns", newColumn);
     console.log(err)
     showMessage("Something went wrong. Please try again.", "error");
   } finally {
+    events.close();
+    showProgress(null);
     toggleLoading(false);
     processBtn.disabled = false;
   }
 });
 
+/* ---------- Progress ---------- */
+function watchProgress(progressId) {
+  const events = new EventSource(`${PROGRESS_URL}/${progressId}`);
+  events.onmessage = e => {
+    const event = JSON.parse(e.data);
+    if (event.state === "done" || event.state === "failed") {
+      events.close();
+      return;
+    }
+    showProgress(event);
+  };
+  return events;
+}
+
+function showProgress(event) {
+  if (!event || !event.batches_total) {
+    progressBox.classList.add("hidden");
+    return;
+  }
+  const percent = Math.round((event.batches_done / event.batches_total) * 100);
+  const parts = [
+    `Batch ${event.batches_done} of ${event.batches_total}`,
+    `${event.rows_done} / ${event.rows_total} rows`,
+    `${event.tokens.toLocaleString()} tokens`
+  ];
+  if (event.eta_seconds !== null) parts.push(`~${Math.ceil(event.eta_seconds)}s left`);
+  if (event.failed_rows) parts.push(`${event.failed_rows} rows failed`);
+  progressFill.style.width = `${percent}%`;
+  progressText.textContent = parts.join(" · ");
+  progressBox.classList.remove("hidden");
+}
+
 /* ---------- Helpers ---------- */
 function toggleLoading(state) {
   loader.classList.toggle("hidden", !state);
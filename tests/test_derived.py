@@ -0,0 +1,107 @@
+import time
+import pandas as pd
+import pytest
+from backend.derived import ExpressionError, evaluate_expression
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({
+        "a": pd.Series([0, 1, 2], dtype="int64[pyarrow]"),
+        "b": pd.Series([1.5, None, 3.0]),
+        "name": pd.Series(["x", "", None], dtype="string[pyarrow]"),
+        "unit price": [10, 20, 30],
+    })
+
+
+def test_arithmetic_and_columns(df):
+    assert evaluate_expression("a * 2 + 1", df).tolist() == [1, 3, 5]
+    assert evaluate_expression('col("unit price") / 10', df).tolist() == [1.0, 2.0, 3.0]
+    assert evaluate_expression("a ** 2", df).tolist() == [0, 1, 4]
+
+
+def test_functions(df):
+    assert evaluate_expression('upper(concat(name, "!"))', df).tolist()[:2] == ["X!", "!"]
+    assert evaluate_expression('if_else(a > 0, "yes", "no")', df).tolist() == ["no", "yes", "yes"]
+    assert evaluate_expression('map(a, {0: "zero"}, "other")', df).tolist() == ["zero", "other", "other"]
+
+
+def test_not_uses_truthiness(df):
+    assert evaluate_expression("not a", df).tolist() == [True, False, False]
+    assert evaluate_expression("not name", df).tolist() == [False, True, True]
+    assert evaluate_expression("not (a > 0)", df).tolist() == [True, False, False]
+
+
+def test_boolean_operators_use_truthiness(df):
+    assert evaluate_expression("a and 2", df).tolist() == [False, True, True]
+    assert evaluate_expression("a or b", df).tolist() == [True, True, True]
+    assert evaluate_expression("2 and 1", df).tolist() == [True, True, True]
+
+
+@pytest.mark.parametrize("expression", [
+    "10 ** 10 ** 7",
+    "2 ** a",
+    "(10 ** 60) ** 60",
+    "a ** 1000",
+])
+def test_rejects_large_powers(df, expression):
+    with pytest.raises(ExpressionError):
+        evaluate_expression(expression, df)
+
+
+@pytest.mark.parametrize("expression", [
+    '"a" * 10 ** 9',
+    '10 ** 9 * "a"',
+    "name * 100000",
+    "name * a",
+])
+def test_rejects_large_repetition(df, expression):
+    with pytest.raises(ExpressionError):
+        evaluate_expression(expression, df)
+
+
+def test_rejected_expressions_fail_fast(df):
+    started = time.perf_counter()
+    for expression in ("9 ** 9 ** 9 ** 9", '"ab" * 10 ** 12'):
+        with pytest.raises(ExpressionError):
+            evaluate_expression(expression, df)
+    assert time.perf_counter() - started < 1
+
+
+@pytest.mark.parametrize("expression", [
+    "__import__('os')",
+    "a.__class__",
+    "[x for x in a]",
+    "lambda: 1",
+    "open('/etc/passwd')",
+    "missing + 1",
+])
+def test_rejects_unsupported_syntax_and_names(df, expression):
+    with pytest.raises(ExpressionError):
+        evaluate_expression(expression, df)
+
+
+def test_small_constant_repetition_is_allowed(df):
+    assert evaluate_expression('"ab" * 3', df).tolist() == ["ababab"] * 3
+
+
+@pytest.mark.parametrize("expression", [
+    '(("x" * 1000) * 1000) * 100',
+    "(name * 1000) * 1000",
+    '"%0100000000d" % 1',
+    "name % 1",
+    'concat("x" * 6000, "x" * 6000)',
+    '("x" * 6000) + ("x" * 6000)',
+    'replace(replace("xxxx", "x", "x" * 100), "x", "x" * 100)',
+    'replace(name, "", "y" * 20000)',
+])
+def test_rejects_nested_growth(df, expression):
+    started = time.perf_counter()
+    with pytest.raises(ExpressionError):
+        evaluate_expression(expression, df)
+    assert time.perf_counter() - started < 1
+
+
+def test_text_below_the_length_limit_is_allowed(df):
+    assert evaluate_expression('length(concat("x" * 5000, name))', df).tolist()[:2] == [5001, 5000]
+    assert evaluate_expression('replace(name, "x", "yz")', df).tolist()[:2] == ["yz", ""]
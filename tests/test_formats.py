@@ -0,0 +1,89 @@
+import gzip
+import io
+import time
+import zipfile
+import pandas as pd
+import pyarrow as pa
+import pytest
+from backend.formats import (PayloadTooLargeError, decompress, detect_input_format, expand_archives, read_frame,
+                             serialize_frame)
+
+CSV = b"city,country\nRome,Italy\nOslo,Norway\n"
+
+
+def zstd(contents: bytes):
+    sink = pa.BufferOutputStream()
+    with pa.output_stream(sink, compression="zstd") as out:
+        out.write(contents)
+    return sink.getvalue().to_pybytes()
+
+
+def parquet(contents: bytes):
+    buffer = io.BytesIO()
+    pd.read_csv(io.BytesIO(contents)).to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("contents, expected", [
+    (CSV, "csv"),
+    (b'{"city": "Rome"}\n{"city": "Oslo"}\n', "jsonl"),
+    (b'  \n{"city": "Rome"}\n', "jsonl"),
+    (gzip.compress(CSV), "gzip"),
+    (zstd(CSV), "zstd"),
+    (parquet(CSV), "parquet"),
+    (b"", "csv"),
+])
+def test_detect_input_format(contents, expected):
+    assert detect_input_format(contents) == expected
+
+
+@pytest.mark.parametrize("compress", [gzip.compress, zstd])
+def test_decompress_detects_the_inner_format(compress):
+    assert decompress(compress(CSV)) == (CSV, "csv")
+    inner = parquet(CSV)
+    assert decompress(compress(inner)) == (inner, "parquet")
+
+
+def test_decompress_leaves_plain_input_alone():
+    assert decompress(CSV, max_bytes=10) == (CSV, "csv")
+
+
+@pytest.mark.parametrize("compress", [gzip.compress, zstd])
+def test_decompress_rejects_payloads_over_the_limit(compress):
+    bomb = compress(b"0" * (64 * 1024 * 1024))
+    started = time.perf_counter()
+    with pytest.raises(PayloadTooLargeError):
+        decompress(bomb, max_bytes=2 * 1024 * 1024)
+    assert time.perf_counter() - started < 1
+    assert decompress(compress(CSV), max_bytes=len(CSV))[0] == CSV
+
+
+def test_round_trip_through_every_output_format():
+    frame = read_frame(CSV, "csv")
+    for output_format in ("csv", "csv.gz", "csv.zst", "parquet"):
+        payload, input_format = decompress(serialize_frame(frame, output_format))
+        assert read_frame(payload, input_format).astype(str).values.tolist() == [["Rome", "Italy"], ["Oslo", "Norway"]]
+
+def make_zip(entries: dict):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, contents in entries.items():
+            archive.writestr(name, contents)
+    return buffer.getvalue()
+
+
+def test_expand_archives_unpacks_zips_and_skips_hidden_entries():
+    archive = make_zip({"a.csv": CSV, "dir/b.csv": CSV, ".hidden": b"x", "__MACOSX/._a.csv": b"x"})
+    files = expand_archives([("plain.csv", CSV), ("bundle.zip", archive)], 1024, 10, 10 * 1024)
+    assert [name for name, _ in files] == ["plain.csv", "a.csv", "b.csv"]
+
+
+@pytest.mark.parametrize("max_entry_bytes, max_files, max_total_bytes", [
+    (1024, 2, 10 * 1024),
+    (10, 10, 10 * 1024),
+    (1024, 10, len(CSV) * 2),
+])
+def test_expand_archives_limits(max_entry_bytes, max_files, max_total_bytes):
+    archive = make_zip({"a.csv": CSV, "b.csv": CSV, "c.csv": CSV})
+    with pytest.raises(ValueError):
+        expand_archives([("bundle.zip", archive)], max_entry_bytes, max_files, max_total_bytes)
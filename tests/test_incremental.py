@@ -0,0 +1,56 @@
+import io
+import pandas as pd
+from backend.formats import read_frame
+from backend.incremental import match_previous, row_hashes
+
+
+def frame(csv: str):
+    return read_frame(csv.encode(), "csv")
+
+
+def test_row_hashes_ignore_the_input_format():
+    csv = frame("city,population\nRome,2800000\nOslo,\n")
+    parquet = io.BytesIO()
+    csv.to_parquet(parquet, index=False)
+    from_parquet = read_frame(parquet.getvalue(), "parquet")
+    assert (row_hashes(csv, ["city", "population"]) == row_hashes(from_parquet, ["city", "population"])).all()
+
+
+def test_unchanged_rows_reuse_previous_values():
+    df = frame("city,kind\nRome,a\nParis,b\nLima,d\nParis,b\n")
+    previous = frame("city,kind,country\nParis,b,France\nRome,a,Italy\n")
+    matched, reused, extra = match_previous(df, previous, ["city", "kind"], ["country"])
+    assert matched.tolist() == [True, True, False, True]
+    assert reused["country"].tolist() == ["Italy", "France", None, "France"]
+    assert extra == []
+
+
+def test_changed_source_values_do_not_match():
+    df = frame("city,kind\nRome,b\n")
+    previous = frame("city,kind,country\nRome,a,Italy\n")
+    matched, reused, _ = match_previous(df, previous, ["city", "kind"], ["country"])
+    assert matched.tolist() == [False]
+    assert reused["country"].tolist() == [None]
+
+
+def test_columns_previous_lacks_are_extra():
+    df = frame("city\nRome\n")
+    previous = frame("city,country\nRome,Italy\n")
+    matched, reused, extra = match_previous(df, previous, ["city"], ["country", "lang"])
+    assert list(reused) == ["country"]
+    assert extra == ["lang"]
+
+
+def test_null_and_blank_previous_values_are_not_reused():
+    df = frame("city\nRome\nOslo\nLima\n")
+    previous = pd.DataFrame({"city": ["Rome", "Oslo", "Lima"], "country": ["Italy", None, "  "]})
+    matched, reused, _ = match_previous(df, previous, ["city"], ["country"])
+    assert matched.tolist() == [True, True, True]
+    assert reused["country"].tolist() == ["Italy", None, None]
+
+
+def test_first_duplicate_in_previous_supplies_the_values():
+    df = frame("city\nRome\n")
+    previous = frame("city,country\nRome,Italy\nRome,Vatican\n")
+    _, reused, _ = match_previous(df, previous, ["city"], ["country"])
+    assert reused["country"].tolist() == ["Italy"]
@@ -0,0 +1,65 @@
+import json
+import pytest
+from backend.json_stream import JsonArrayStreamParser
+
+
+def feed_all(parser, pieces):
+    items = []
+    for piece in pieces:
+        items.extend(parser.feed(piece))
+    return items
+
+
+def test_yields_each_object_as_it_closes():
+    parser = JsonArrayStreamParser()
+    assert parser.feed('[{"__row_id__": 0, "a": 1}, {"__row_id__"') == [{"__row_id__": 0, "a": 1}]
+    assert parser.feed(': 1, "a": 2}]') == [{"__row_id__": 1, "a": 2}]
+    assert parser.errors == 0
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7])
+def test_chunk_boundaries_do_not_matter(size):
+    rows = [{"__row_id__": i, "city": f"C{i}", "note": 'a "quoted" ] } value'} for i in range(5)]
+    text = json.dumps(rows)
+    parser = JsonArrayStreamParser()
+    assert feed_all(parser, [text[i:i + size] for i in range(0, len(text), size)]) == rows
+
+
+def test_brackets_and_escapes_inside_strings():
+    rows = [
+        {"a": "[not] {an} array"},
+        {"a": 'ends with a backslash \\'},
+        {"a": 'escaped quote \\" then ]}'},
+        {"a": {"nested": [1, 2]}},
+    ]
+    parser = JsonArrayStreamParser()
+    assert feed_all(parser, [json.dumps(rows)]) == rows
+
+
+def test_skips_text_before_the_array():
+    parser = JsonArrayStreamParser()
+    assert parser.feed('Here you go:\n```json\n[{"a": 1}]\n```') == [{"a": 1}]
+
+
+def test_truncated_input_keeps_complete_objects():
+    parser = JsonArrayStreamParser()
+    assert feed_all(parser, ['[{"a": 1}, {"a": 2}, {"a": "cut o']) == [{"a": 1}, {"a": 2}]
+    assert parser.errors == 0
+
+
+def test_invalid_objects_are_dropped_and_counted():
+    parser = JsonArrayStreamParser()
+    assert parser.feed('[{"a": 1}, {"a": tru}, {"a": 3}]') == [{"a": 1}, {"a": 3}]
+    assert parser.errors == 1
+
+
+def test_positional_rows():
+    parser = JsonArrayStreamParser(list)
+    text = '{"rows": [[0, "High", 3], [1, "a ] b", null], [2, "Low"'
+    assert feed_all(parser, [text]) == [[0, "High", 3], [1, "a ] b", None]]
+
+
+def test_items_of_the_wrong_type_are_dropped():
+    parser = JsonArrayStreamParser(list)
+    assert parser.feed('[{"a": 1}, [0, "x"]]') == [[0, "x"]]
+    assert parser.errors == 1
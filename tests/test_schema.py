@@ -0,0 +1,66 @@
+import json
+import pandas as pd
+from fastapi.responses import JSONResponse
+from backend.schema import parse_column_schema, schema_vocabularies, conform_frame, validate_positional_rows
+
+SCHEMA = {
+    "priority": {"type": "string", "enum": ["High", "Low"]},
+    "count": {"type": "integer", "enum": None},
+    "score": {"type": "number", "enum": None},
+    "active": {"type": "boolean", "enum": None},
+    "note": {"type": "string", "enum": None},
+}
+COLUMNS = list(SCHEMA)
+
+
+def test_integer_coercion():
+    frame = pd.DataFrame({"count": ["3", 4, "5.0", "2.5", "many", None]}, dtype=object)
+    assert conform_frame(frame, SCHEMA).to_dict(orient="list") == {"count": [3, 4, 5, None, None, None]}
+
+
+def test_number_coercion():
+    frame = pd.DataFrame({"score": ["1.5", 2, "1e3", "n/a"]}, dtype=object)
+    assert conform_frame(frame, SCHEMA).to_dict(orient="list") == {"score": [1.5, 2.0, 1000.0, None]}
+
+
+def test_boolean_coercion():
+    frame = pd.DataFrame({"active": [True, "false", " TRUE ", "yes", 1, None]}, dtype=object)
+    assert conform_frame(frame, SCHEMA).to_dict(orient="list") == {"active": [True, False, True, None, None, None]}
+
+
+def test_enum_values_are_matched_case_insensitively():
+    frame = pd.DataFrame({"priority": ["high", " LOW ", "Medium", None]}, dtype=object)
+    assert conform_frame(frame, SCHEMA).to_dict(orient="list") == {"priority": ["High", "Low", None, None]}
+
+
+def test_blank_strings_become_none():
+    frame = pd.DataFrame({"note": [" kept ", "", "   ", None]}, dtype=object)
+    assert conform_frame(frame, SCHEMA).to_dict(orient="list") == {"note": ["kept", None, None, None]}
+
+
+def test_validate_positional_rows():
+    rows = [["high", "2", "0.5", "true", "ok"], ["urgent", "x", None, "no", ""]]
+    assert validate_positional_rows(rows, COLUMNS, SCHEMA) == [
+        {"priority": "High", "count": 2, "score": 0.5, "active": True, "note": "ok"},
+        {"priority": None, "count": None, "score": None, "active": None, "note": None},
+    ]
+
+
+def test_parse_column_schema_defaults_to_string():
+    schema = parse_column_schema(json.dumps({"score": {"type": "number"}}), ["score", "note"])
+    assert schema == {"score": {"type": "number", "enum": None}, "note": {"type": "string", "enum": None}}
+    assert parse_column_schema(None, ["score"]) == {}
+
+
+def test_parse_column_schema_ignores_derived_columns():
+    schema = parse_column_schema(json.dumps({"total": {"type": "number"}}), ["note"], ["total"])
+    assert schema == {"note": {"type": "string", "enum": None}}
+
+
+def test_parse_column_schema_errors():
+    for column_schema in ("not json", '["a"]', '{"missing": {}}', '{"a": {"type": "date"}}', '{"a": {"enum": []}}'):
+        assert isinstance(parse_column_schema(column_schema, ["a"]), JSONResponse)
+
+
+def test_schema_vocabularies():
+    assert schema_vocabularies(SCHEMA) == {"priority": {"high", "low"}}